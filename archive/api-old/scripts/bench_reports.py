@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Offline scale benchmark of the report scripts against fake_inspection_server.py.
+For each scale (TGFEST rows) a synthetic database is generated, the fake endpoint
+is started in-process and every case runs as a subprocess in a scratch working
+directory (INSPECTION_URL pointed at the fake, query cache off). Wall time,
+output rows, rows/s and peak RSS of the child are printed and appended to
+bench_results.jsonl, so runs can be compared across commits.
+Cases:
+    tree             generate_local_tree.py 101000 --rollup
+    tree_incremental generate_local_tree.py 101000 --incremental, run twice (full build, then delta)
+    descendants      discover_descendants.py -> assemble_descendant_paths.py -> descendants_products_report.py
+    pipeline         report_pipeline.py (the same chain in one process, plus one local report)
+The rate-limited scripts run with --rate 0, so the timings measure the code and
+not the requests/second limit.
+Usage:
+    python3 scripts/bench_reports.py [--scales 1000,10000,100000,1000000] [--cases tree,descendants]
+                                     [--latency-ms 5] [--error-rate 0.01] [--workdir DIR] [--out FILE]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_inspection_server import FakeInspectionServer, generate_db
+
+SCRIPTS = Path(__file__).resolve().parent
+ROOT = 101000
+CASES = {
+    'tree': [['generate_local_tree.py', str(ROOT), '--rollup']],
+    'tree_incremental': [['generate_local_tree.py', str(ROOT), '--incremental'],
+                         ['generate_local_tree.py', str(ROOT), '--incremental']],
+    'descendants': [['discover_descendants.py'], ['assemble_descendant_paths.py'],
+                    ['descendants_products_report.py', '--rate', '0']],
+    'pipeline': [['report_pipeline.py', '--root', str(ROOT), '--locals', str(ROOT * 10 + 1), '--rate', '0']],
+}
+# the .jsonl whose line count is reported as the case's output rows
+OUTPUTS = {
+    'tree': f'tree_{ROOT}_products.jsonl',
+    'tree_incremental': f'tree_{ROOT}_products.jsonl',
+    'descendants': f'descendants_{ROOT}_products.jsonl',
+    'pipeline': f'descendants_{ROOT}_products.jsonl',
+}
+
+
+def run_step(argv, cwd, env):
+    """Run one script; returns (seconds, peak RSS in MB, returncode)."""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, str(SCRIPTS / argv[0]), *argv[1:]], cwd=cwd, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - started
+    if proc.returncode:
+        print(out.decode('utf-8', 'replace')[-2000:])
+    # ru_maxrss is in KiB on Linux
+    return seconds, usage.ru_maxrss / 1024, proc.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the report scripts against the fake endpoint.')
+    parser.add_argument('--scales', default='1000,10000,100000,1000000', help='TGFEST rows per run, comma separated')
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--workdir', type=Path, help='keep databases and outputs here (default: temporary)')
+    parser.add_argument('--out', type=Path, default=Path('bench_results.jsonl'))
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='bench_reports_'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"{'case':<18} {'rows in':>9} {'rows out':>9} {'seconds':>9} {'rows/s':>10} {'peak MB':>8}")
+    for scale in (int(s) for s in args.scales.split(',')):
+        db = workdir / f'fake_{scale}.sqlite'
+        if not db.exists():
+            generate_db(db, ROOT, args.depth, args.fanout, stock_rows=scale)
+        server = FakeInspectionServer(db, latency=args.latency_ms / 1000, error_rate=args.error_rate, seed=scale)
+        server.start()
+        try:
+            for case in args.cases.split(','):
+                cwd = workdir / f'{case}_{scale}'
+                shutil.rmtree(cwd, ignore_errors=True)
+                base = cwd / 'docs/sqls/estoque-locais'
+                base.mkdir(parents=True)
+                (base / 'auth_token.txt').write_text('bench')
+                env = {**os.environ, 'INSPECTION_URL': server.url, 'INSPECTION_CACHE': '0'}
+                env.pop('INSPECTION_TRACE', None)
+                steps = []
+                for argv in CASES[case]:
+                    steps.append(run_step(argv, cwd, env))
+                    if steps[-1][2]:
+                        break
+                out_file = base / OUTPUTS[case]
+                rows = sum(1 for _ in out_file.open()) if out_file.exists() else 0
+                seconds = sum(s for s, _, _ in steps)
+                result = {
+                    'case': case, 'scale': scale, 'rows': rows, 'seconds': round(seconds, 3),
+                    'rows_per_s': round(rows / seconds, 1) if seconds else None,
+                    'peak_rss_mb': round(max(m for _, m, _ in steps), 1),
+                    'steps': [{'argv': argv, 'seconds': round(s, 3), 'peak_rss_mb': round(m, 1), 'returncode': rc}
+                              for argv, (s, m, rc) in zip(CASES[case], steps)],
+                    'ok': all(rc == 0 for _, _, rc in steps) and len(steps) == len(CASES[case]),
+                    'latency_ms': args.latency_ms, 'error_rate': args.error_rate,
+                    'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                }
+                with args.out.open('a') as f:
+                    f.write(json.dumps(result) + '\n')
+                flag = '' if result['ok'] else '  FAILED'
+                print(f"{case:<18} {scale:>9} {rows:>9} {seconds:>9.2f} {result['rows_per_s'] or 0:>10.0f} "
+                      f"{result['peak_rss_mb']:>8.1f}{flag}")
+        finally:
+            server.stop()
+    print('Results appended to', args.out, '; scratch files in', workdir)
+
+
+if __name__ == '__main__':
+    main()
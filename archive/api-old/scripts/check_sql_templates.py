@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Pinned rewrites of the single-product SQL templates (see sql_templates.py).
+Runs run_sql_template.py --dry-run on each of TEMPLATES and compares its output
+with sql_template_checks/{NAME}.dry-run.txt, then plans the inline CASES, whose
+plan and rewritten SQL are known (e.g. a TOP n whose ORDER BY names a select
+alias must not become a ROW_NUMBER window: the alias is not visible there).
+Exits 1 on any difference.
+Usage: python3 scripts/check_sql_templates.py [--update]
+--update rewrites the pinned outputs after a deliberate change to the rewriter.
+"""
+import argparse
+import difflib
+import subprocess
+import sys
+from pathlib import Path
+
+from sql_templates import SqlTemplate
+
+SCRIPTS = Path(__file__).resolve().parent
+SQL_DIR = SCRIPTS.parents[2] / 'sql'
+PINNED = SCRIPTS / 'sql_template_checks'
+TEMPLATES = ['consumo_produto_template', 'ultima-compra-produto', 'saldo-anterior-com-ultima-compra']
+CODPRODS = '3680,9558'
+
+_TOP_FROM = """FROM TGFCAB c
+JOIN TGFITE i ON i.NUNOTA = c.NUNOTA
+WHERE i.CODPROD = 3680
+"""
+
+# (name, template text, expected mode, expected rewritten SQL or error)
+CASES = [
+    ('top_order_by_expression',
+     'SELECT TOP 3 c.NUNOTA, COALESCE(c.DTENTSAI, c.DTNEG) AS data_compra\n' + _TOP_FROM
+     + 'ORDER BY COALESCE(c.DTENTSAI, c.DTNEG) DESC',
+     'set',
+     'SELECT * FROM (SELECT i.CODPROD AS CODPROD, c.NUNOTA, COALESCE(c.DTENTSAI, c.DTNEG) AS data_compra, '
+     'ROW_NUMBER() OVER (PARTITION BY i.CODPROD ORDER BY COALESCE(c.DTENTSAI, c.DTNEG) DESC) AS RN__ '
+     'FROM TGFCAB c\nJOIN TGFITE i ON i.NUNOTA = c.NUNOTA\nWHERE i.CODPROD {in}) T__ '
+     'WHERE T__.RN__ <= 3 ORDER BY T__.CODPROD, T__.RN__;'),
+    ('top_order_by_alias',
+     'SELECT TOP 3 c.NUNOTA, COALESCE(c.DTENTSAI, c.DTNEG) AS data_compra\n' + _TOP_FROM
+     + 'ORDER BY data_compra DESC, c.NUNOTA',
+     'each',
+     'SELECT TOP 3 c.NUNOTA, COALESCE(c.DTENTSAI, c.DTNEG) AS data_compra\n'
+     'FROM TGFCAB c\nJOIN TGFITE i ON i.NUNOTA = c.NUNOTA\nWHERE i.CODPROD = {codprod}\n'
+     'ORDER BY data_compra DESC, c.NUNOTA'),
+    ('top_order_by_bracketed_alias',
+     'SELECT TOP 1 c.NUNOTA, i.VLRUNIT AS [valor]\n' + _TOP_FROM + 'ORDER BY [valor]',
+     'each', None),
+    ('top_order_by_assigned_alias',
+     'SELECT TOP 1 c.NUNOTA, valor = i.VLRUNIT\n' + _TOP_FROM + 'ORDER BY valor ASC',
+     'each', None),
+    ('order_by_alias_without_top',
+     'SELECT c.NUNOTA, COALESCE(c.DTENTSAI, c.DTNEG) AS data_compra\n' + _TOP_FROM
+     + 'ORDER BY data_compra DESC',
+     'set',
+     'SELECT i.CODPROD AS CODPROD, c.NUNOTA, COALESCE(c.DTENTSAI, c.DTNEG) AS data_compra\n'
+     'FROM TGFCAB c\nJOIN TGFITE i ON i.NUNOTA = c.NUNOTA\nWHERE i.CODPROD {in}\n'
+     'ORDER BY i.CODPROD, data_compra DESC;'),
+    ('order_by_position',
+     'SELECT c.NUNOTA, c.DTNEG\n' + _TOP_FROM + 'ORDER BY 2 DESC',
+     'each', None),
+]
+
+
+def dry_run(name):
+    out = subprocess.run([sys.executable, str(SCRIPTS / 'run_sql_template.py'), str(SQL_DIR / f'{name}.sql'),
+                          '--codprods', CODPRODS, '--dry-run'], capture_output=True, text=True, check=True)
+    return out.stdout
+
+
+def check_templates(update):
+    failed = 0
+    PINNED.mkdir(exist_ok=True)
+    for name in TEMPLATES:
+        path = PINNED / f'{name}.dry-run.txt'
+        got = dry_run(name)
+        if update:
+            path.write_text(got, encoding='utf-8')
+            print('Wrote', path)
+            continue
+        want = path.read_text(encoding='utf-8') if path.exists() else ''
+        if got != want:
+            failed += 1
+            print(f'FAIL {name}')
+            sys.stdout.writelines(difflib.unified_diff(want.splitlines(True), got.splitlines(True),
+                                                       str(path), 'dry-run'))
+        else:
+            print(f'ok   {name}')
+    return failed
+
+
+def check_cases():
+    failed = 0
+    for name, text, mode, expected in CASES:
+        stmt = SqlTemplate(text, name).statements[0]
+        problems = []
+        if stmt.mode != mode:
+            problems.append(f'mode {stmt.mode!r} ({stmt.error}), expected {mode!r}')
+        if 'ROW_NUMBER' in (stmt.template or '') and mode != 'set':
+            problems.append('emitted a ROW_NUMBER window')
+        if expected is not None and stmt.template != expected:
+            problems.append(f'rewrote to\n{stmt.template}\nexpected\n{expected}')
+        print(f'{"FAIL" if problems else "ok  "} {name}', *problems, sep='\n     ' if problems else ' ')
+        failed += bool(problems)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the pinned rewrites of the sql/ templates.')
+    parser.add_argument('--update', action='store_true', help='rewrite the pinned --dry-run outputs')
+    args = parser.parse_args()
+    failed = check_templates(args.update) + (0 if args.update else check_cases())
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
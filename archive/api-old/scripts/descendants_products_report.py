@@ -1,97 +1,80 @@
 #!/usr/bin/env python3
+"""Per-product stock for every local in descendants_101000_paths.json.
+Usage: python3 scripts/descendants_products_report.py [--incremental [--full] | --resume] [--rate 20]
+report_pipeline.py runs this together with the discovery and path steps, in memory.
+--incremental refetches only locals with stock movements since the last run
+(stock_snapshot.sqlite) and also writes descendants_101000_changes.*.
+Each local's response is journaled as it arrives (journals/descendants_products_report.jsonl);
+after an interruption --resume reuses the completed locals and only queries the rest.
+INSPECTION_TRACE=1 records per-query and per-stage timings (see tracing.py).
+"""
+import argparse
 import json
-import subprocess
-import time
 from pathlib import Path
 
+import stock_snapshot
+from inspection_client import client_from_base
+from job_journal import JobJournal
+from query_executor import QueryExecutor
+from report_pipeline import write_products
+from report_writers import write_report
+from stock_queries import LOCAL_PRODUCTS_QUERY
+from stock_snapshot import CHANGE_FIELDS, StockSnapshot
+from tracing import stage
+
+parser = argparse.ArgumentParser(description='Per-product stock for each descendant local.')
+parser.add_argument('--incremental', action='store_true', help='only refetch locals with stock movements since the last run')
+parser.add_argument('--full', action='store_true', help='with --incremental, refetch every local')
+parser.add_argument('--resume', action='store_true', help='continue an interrupted run from its journal')
+parser.add_argument('--rate', type=float, default=20, help='requests/second against the inspection host (0: unthrottled)')
+ARGS = parser.parse_args()
+
+MAX_WORKERS = 8
+
 base = Path('docs/sqls/estoque-locais')
 paths_file = base / 'descendants_101000_paths.json'
 paths = json.loads(paths_file.read_text())
 
-token = Path(base / 'auth_token.txt').read_text().strip()
-
-out_rows = []
-
-for node in paths:
-    cod = node['CODLOCAL']
-    # per-product aggregates for this local
-    q = f"SELECT P.CODPROD, LTRIM(RTRIM(P.DESCRPROD)) AS DESCRPROD, LTRIM(RTRIM(P.UNIDADE)) AS UNIDADE, LTRIM(RTRIM(P.MARCA)) AS MARCA, P.NCM, SUM(ISNULL(E.ESTOQUE,0)) AS TOTAL_ESTOQUE FROM [SANKHYA].[TGFEST] E JOIN [SANKHYA].[TGFPRO] P ON P.CODPROD = E.CODPROD WHERE E.CODLOCAL = {cod} GROUP BY P.CODPROD, P.DESCRPROD, P.UNIDADE, P.MARCA, P.NCM ORDER BY P.DESCRPROD;"
-    cmd = [
-        'curl','-s','-X','POST','https://api-dbexplorer-nestjs-production.gigantao.net/inspection/query',
-        '-H','accept: application/json',
-        '-H', f'Authorization: Bearer {token}',
-        '-H','Content-Type: application/json',
-        '-d', json.dumps({'query': q, 'params': []})
-    ]
-    tries = 0
-    resp = None
-    while tries < 4:
-        p = subprocess.run(cmd, capture_output=True, text=True)
-        try:
-            resp = json.loads(p.stdout)
-            if resp.get('statusCode') == 500:
-                raise ValueError('500')
-            break
-        except Exception:
-            tries += 1
-            time.sleep(1 + tries)
-    if not resp:
-        print('Failed to fetch products for', cod)
-        continue
-    data = resp.get('data', [])
-    if not data:
-        # no products, but still add one row with zero
-        out_rows.append({
-            'CODLOCAL': cod,
-            'DESCRLOCAL': node['DESCRLOCAL'],
-            'LOCAL_PATH': node['LOCAL_PATH'],
-            'LOCAL_PATH_CODES': node['LOCAL_PATH_CODES'],
-            'LOCAL_DEPTH': node['LOCAL_DEPTH'],
-            'CODPROD': None,
-            'DESCRPROD': None,
-            'UNIDADE': None,
-            'MARCA': None,
-            'NCM': None,
-            'TOTAL_ESTOQUE': 0
-        })
-    else:
-        for r in data:
-            out_rows.append({
-                'CODLOCAL': cod,
-                'DESCRLOCAL': node['DESCRLOCAL'],
-                'LOCAL_PATH': node['LOCAL_PATH'],
-                'LOCAL_PATH_CODES': node['LOCAL_PATH_CODES'],
-                'LOCAL_DEPTH': node['LOCAL_DEPTH'],
-                'CODPROD': r.get('CODPROD'),
-                'DESCRPROD': r.get('DESCRPROD'),
-                'UNIDADE': r.get('UNIDADE'),
-                'MARCA': r.get('MARCA'),
-                'NCM': r.get('NCM'),
-                'TOTAL_ESTOQUE': r.get('TOTAL_ESTOQUE')
-            })
+client = client_from_base(base, pool_size=MAX_WORKERS)
 
-# write outputs
-out_json = base / 'descendants_101000_products.json'
-out_csv = base / 'descendants_101000_products.csv'
-out_txt = base / 'descendants_101000_products.txt'
-out_json.write_text(json.dumps(out_rows, ensure_ascii=False, indent=2))
+cods = [node['CODLOCAL'] for node in paths]
+by_cod = {node['CODLOCAL']: node for node in paths}
+executor = None
+journal = None
+changes = None
 
-# CSV
-import csv
-with out_csv.open('w', newline='') as f:
-    if out_rows:
-        writer = csv.DictWriter(f, fieldnames=list(out_rows[0].keys()))
-        writer.writeheader()
-        writer.writerows(out_rows)
+if ARGS.incremental:
+    # delta against the snapshot; every local is then read back from it
+    snapshot = StockSnapshot(base / 'stock_snapshot.sqlite')
+    with stage('products_delta') as s:
+        refetched, changes = stock_snapshot.sync(client, snapshot, cods, full=ARGS.full)
+        s.update(refetched=len(refetched), changes=len(changes))
+    print('Refetched', len(refetched), 'of', len(paths), 'locals;', len(changes), 'changes')
+    results = (snapshot.rows(cod) for cod in cods)
+else:
+    # per-product aggregates for each local: one parameterized statement, fanned out
+    # concurrently (results come back in order)
+    queries = [(LOCAL_PRODUCTS_QUERY, [cod]) for cod in cods]
+    journal = JobJournal(base / 'journals' / 'descendants_products_report.jsonl', resume=ARGS.resume)
+    executor = QueryExecutor(client, max_workers=MAX_WORKERS, rate=ARGS.rate, journal=journal)
+    results = (resp.get('data', []) for resp in executor.map(queries))
 
-# pretty txt
-with out_txt.open('w') as f:
-    if out_rows:
-        headers = list(out_rows[0].keys())
-        widths = {h: max(len(h), max((len(str(r.get(h,''))) for r in out_rows))) for h in headers}
-        f.write(' | '.join(h.ljust(widths[h]) for h in headers) + '\n')
-        f.write('-+-'.join('-'*widths[h] for h in headers) + '\n')
-        for r in out_rows:
-            f.write(' | '.join(str(r.get(h,'')).ljust(widths[h]) for h in headers) + '\n')
+# rows are written as responses arrive, in node order; a failed local raises instead of
+# being reported as zero stock
+with stage('products+write') as s:
+    out = write_products(base / 'descendants_101000_products', by_cod, zip(cods, results))
+    if executor:
+        executor.close()
+    s['rows'] = out.count
+print('Wrote', *out.paths, 'rows:', out.count)
+if journal:
+    if journal.hits:
+        print('Reused', journal.hits, 'locals from the journal')
+    journal.finish()
 
-print('Wrote', out_json, out_csv, out_txt, 'rows:', len(out_rows))
+if changes is not None:
+    w = write_report(base / 'descendants_101000_changes',
+                     ({**c, 'LOCAL_PATH': by_cod[c['CODLOCAL']]['LOCAL_PATH']} for c in changes),
+                     CHANGE_FIELDS[:1] + ['LOCAL_PATH'] + CHANGE_FIELDS[1:])
+    print('Wrote', *w.paths, 'rows:', w.count)
+    snapshot.close()
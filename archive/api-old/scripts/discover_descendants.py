@@ -1,47 +1,22 @@
 #!/usr/bin/env python3
+"""Descendants of 101000 -> descendants_101000.json (step 1 of the file-based chain;
+report_pipeline.py runs the whole chain in memory)."""
 import json
-import subprocess
 from pathlib import Path
 
+from inspection_client import client_from_base
+from report_pipeline import discover
+from tracing import stage
+
 base = Path('docs/sqls/estoque-locais')
 base.mkdir(parents=True, exist_ok=True)
-token = Path(base / 'auth_token.txt').read_text().strip()
+client = client_from_base(base)
 
 start = 101000
-seen = set([start])
-frontier = {start}
-all_nodes = {}
-
-while frontier:
-    # Query direct children for current frontier
-    in_list = ','.join(str(x) for x in frontier)
-    query = f"SELECT CODLOCAL, CODLOCALPAI, LTRIM(RTRIM(DESCRLOCAL)) AS DESCRLOCAL FROM [SANKHYA].[TGFLOC] WHERE CODLOCALPAI IN ({in_list}) ORDER BY CODLOCAL;"
-    cmd = [
-        'curl', '-s', '-X', 'POST', 'https://api-dbexplorer-nestjs-production.gigantao.net/inspection/query',
-        '-H', 'accept: application/json',
-        '-H', f'Authorization: Bearer {token}',
-        '-H', 'Content-Type: application/json',
-        '-d', json.dumps({'query': query, 'params': []})
-    ]
-    try:
-        p = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        resp = json.loads(p.stdout)
-    except subprocess.CalledProcessError as e:
-        print('curl failed:', e)
-        break
-    except json.JSONDecodeError:
-        print('failed to decode response:', p.stdout[:200])
-        break
-
-    data = resp.get('data', [])
-    new_frontier = set()
-    for r in data:
-        cod = r['CODLOCAL']
-        all_nodes[cod] = r
-        if cod not in seen:
-            new_frontier.add(cod)
-            seen.add(cod)
-    frontier = new_frontier
+# root + descendants in one recursive-CTE query (chunked BFS fallback); keep descendants only
+with stage('discover', root=start) as s:
+    all_nodes = discover(client, start)
+    s['locals'] = len(all_nodes)
 
 # save result
 out_file = base / f'descendants_{start}.json'
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""Local stand-in for POST /inspection/query, backed by SQLite.
+Generates a synthetic TGFLOC tree (configurable depth and fan-out under ROOT)
+with TGFPRO/TGFEST/TGFCAB/TGFITE rows at a configurable scale, and answers the
+report scripts' SQL Server statements by rewriting the handful of dialect
+differences they use (TOP, [SANKHYA]. prefixes, ISNULL, GETDATE, CHECKSUM_AGG,
+recursive CTEs, TOP n in CTE bodies, string concatenation with '+'), so the
+recursive-CTE discovery with server-side paths runs offline too. With
+--reject-concat, statements that concatenate strings with '+' are answered with
+a 500 instead, as an endpoint rejecting them would, so the scripts' BFS /
+level-by-level fallbacks can be exercised. Latency, 500s and 429s can be
+injected.
+Usage:
+    python3 scripts/fake_inspection_server.py --db /tmp/fake.sqlite --generate --stock-rows 100000
+    python3 scripts/fake_inspection_server.py --db /tmp/fake.sqlite --port 8765 --latency-ms 20 --error-rate 0.01
+    python3 scripts/fake_inspection_server.py --db /tmp/fake.sqlite --reject-concat
+    INSPECTION_URL=http://127.0.0.1:8765/inspection/query python3 scripts/generate_local_tree.py
+"""
+import argparse
+import gzip
+import json
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCHEMA = """
+CREATE TABLE TGFLOC (CODLOCAL INTEGER PRIMARY KEY, CODLOCALPAI INTEGER, DESCRLOCAL TEXT, AD_DESCRBASE TEXT,
+                     UTILIZAWMS TEXT, CAPACIDADEPRODUCAO REAL, CODPARC INTEGER);
+CREATE INDEX TGFLOC_PAI ON TGFLOC (CODLOCALPAI);
+CREATE TABLE TGFPAR (CODPARC INTEGER PRIMARY KEY, NOMEPARC TEXT, RAZAOSOCIAL TEXT, CGC_CPF TEXT, TELEFONE TEXT,
+                     EMAIL TEXT);
+CREATE TABLE TGFPRO (CODPROD INTEGER PRIMARY KEY, DESCRPROD TEXT, UNIDADE TEXT, MARCA TEXT, NCM TEXT);
+CREATE TABLE TGFEST (CODEMP INTEGER, CODLOCAL INTEGER, CODPROD INTEGER, CONTROLE TEXT, ESTOQUE REAL, DTULTMOV TEXT,
+                     PRIMARY KEY (CODEMP, CODLOCAL, CODPROD, CONTROLE));
+CREATE INDEX TGFEST_LOCAL ON TGFEST (CODLOCAL, CODPROD);
+CREATE INDEX TGFEST_DTULTMOV ON TGFEST (DTULTMOV);
+CREATE TABLE TGFCAB (NUNOTA INTEGER PRIMARY KEY, CODEMP INTEGER, TIPMOV TEXT, STATUSNOTA TEXT, DTNEG TEXT, DTALTER TEXT);
+CREATE INDEX TGFCAB_DTALTER ON TGFCAB (DTALTER);
+CREATE TABLE TGFITE (NUNOTA INTEGER, SEQUENCIA INTEGER, CODEMP INTEGER, CODPROD INTEGER, CODLOCALORIG INTEGER,
+                     QTDNEG REAL, VLRUNIT REAL, PRIMARY KEY (NUNOTA, SEQUENCIA));
+CREATE INDEX TGFITE_PROD ON TGFITE (CODPROD);
+CREATE INDEX TGFITE_LOCAL ON TGFITE (CODLOCALORIG);
+"""
+
+UNITS = ('UN', 'PC', 'KG', 'CX', 'MT', 'LT')
+BRANDS = ('ACME', 'GENERICA', 'NORTE', 'SUL', 'TECNO', None)
+PARTNERS = 5  # TGFPAR rows; CODPARC 0 is the '<SEM PARCEIRO>' placeholder
+
+
+def tree_size(depth, fanout):
+    """Locals in a tree of DEPTH levels below the root with FANOUT children each."""
+    return sum(fanout ** d for d in range(depth + 1))
+
+
+def generate_db(path, root=101000, depth=4, fanout=6, products=None, stock_rows=10000, notes=None, seed=1):
+    """Write a synthetic database to PATH; returns {'locals', 'products', 'stock_rows', 'notes'}."""
+    rnd = random.Random(seed)
+    db = sqlite3.connect(str(path))
+    db.executescript(';'.join(f'DROP TABLE IF EXISTS {t}' for t in ('TGFLOC', 'TGFPAR', 'TGFPRO', 'TGFEST', 'TGFCAB', 'TGFITE')))
+    db.executescript(SCHEMA)
+    locs = [(root, 0, f'  ROOT {root} ', 'BASE', 'N', None, None)]
+    level, next_cod = [root], root * 10
+    for d in range(1, depth + 1):
+        children = []
+        for parent in level:
+            for i in range(fanout):
+                next_cod += 1
+                locs.append((next_cod, parent, f'LOCAL {d}.{i} ({next_cod})', None, rnd.choice('SN'),
+                             rnd.choice((None, 100.0, 500.0)), next_cod % PARTNERS))
+                children.append(next_cod)
+        level = children
+    db.executemany('INSERT INTO TGFLOC VALUES (?, ?, ?, ?, ?, ?, ?)', locs)
+    db.executemany('INSERT INTO TGFPAR VALUES (?, ?, ?, ?, ?, ?)',
+                   [(0, '<SEM PARCEIRO>                          ', None, None, None, None)] +
+                   [(c, f'PARCEIRO {c} ', f'PARCEIRO {c} LTDA', f'{c:014d}', None, f'parceiro{c}@example.com')
+                    for c in range(1, PARTNERS)])
+    cods = [row[0] for row in locs]
+    per_local = max(1, -(-stock_rows // len(cods)))
+    products = products or max(500, 2 * per_local)
+    db.executemany('INSERT INTO TGFPRO VALUES (?, ?, ?, ?, ?)',
+                   ((p, f' PRODUTO {p:07d} ', rnd.choice(UNITS), rnd.choice(BRANDS), f'{rnd.randrange(10 ** 8):08d}')
+                    for p in range(1, products + 1)))
+    today = datetime(2026, 1, 1)
+
+    def when(days=365):
+        return (today - timedelta(days=rnd.randrange(days), seconds=rnd.randrange(86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+    def est_rows():
+        left = stock_rows
+        for cod in cods:
+            k = min(per_local, left, products)
+            for p in rnd.sample(range(1, products + 1), k):
+                yield 1, cod, p, ' ', round(rnd.uniform(0, 500), 2), when()[:10] + ' 00:00:00'
+            left -= k
+            if left <= 0:
+                return
+    db.executemany('INSERT INTO TGFEST VALUES (?, ?, ?, ?, ?, ?)', est_rows())
+    notes = stock_rows // 10 if notes is None else notes
+    db.executemany('INSERT INTO TGFCAB VALUES (?, ?, ?, ?, ?, ?)',
+                   ((n, 1, rnd.choice('OOVQ'), rnd.choice('LLLA'), when(), when(30)) for n in range(1, notes + 1)))
+    db.executemany('INSERT INTO TGFITE VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   ((n, s, 1, rnd.randrange(1, products + 1), rnd.choice(cods), rnd.randrange(1, 50),
+                     round(rnd.uniform(1, 300), 2))
+                    for n in range(1, notes + 1) for s in range(1, rnd.randrange(2, 6))))
+    db.commit()
+    db.close()
+    return {'locals': len(cods), 'products': products, 'stock_rows': min(stock_rows, per_local * len(cods)),
+            'notes': notes}
+
+
+# -- SQL Server -> SQLite
+_TOP = re.compile(r'^\s*SELECT\s+TOP\s+(\d+)\s+', re.IGNORECASE)
+_REWRITES = [
+    (re.compile(r'\[SANKHYA\]\.', re.IGNORECASE), ''),
+    (re.compile(r'\[(\w+)\]'), r'\1'),
+    (re.compile(r'\bISNULL\s*\(', re.IGNORECASE), 'IFNULL('),
+    (re.compile(r'CONVERT\s*\(\s*VARCHAR\s*\(\s*\d+\s*\)\s*,\s*GETDATE\(\)\s*,\s*120\s*\)', re.IGNORECASE), 'GETDATE()'),
+    (re.compile(r'CAST\s*\(\s*\?\s+AS\s+DATE\s*\)', re.IGNORECASE), 'date(?)'),
+    (re.compile(r'\bAS\s+VARCHAR\s*\(\s*(?:\d+|MAX)\s*\)', re.IGNORECASE), 'AS TEXT'),
+    (re.compile(r'\s*OPTION\s*\(\s*MAXRECURSION\s+\d+\s*\)', re.IGNORECASE), ''),
+    (re.compile(r'^\s*WITH\s+', re.IGNORECASE), 'WITH RECURSIVE '),
+]
+_CONCAT = re.compile(r"'\s*\+|\+\s*'")
+_STRING = re.compile(r"('(?:[^']|'')*')")
+# '+' not followed by a number literal (LVL + 1 stays arithmetic)
+_PLUS = re.compile(r'\+(?!\s*\d)')
+# TOP n inside a parenthesized body without nested parentheses (a CTE like ROOTP)
+_INNER_TOP = re.compile(r'\(\s*SELECT\s+TOP\s+(\d+)\s+([^()]*?)\s*\)', re.IGNORECASE)
+
+
+class Unsupported(Exception):
+    pass
+
+
+def concat_to_pipes(sql):
+    """Rewrite '+' outside string literals to '||', except before a number literal.
+    Only applied to statements that concatenate strings, where every '+' between
+    non-numeric operands is a concatenation."""
+    parts = _STRING.split(sql)
+    return ''.join(part if i % 2 else _PLUS.sub('||', part) for i, part in enumerate(parts))
+
+
+def translate(query, reject_concat=False):
+    """Rewrite a report statement for SQLite; raises Unsupported when it cannot be emulated."""
+    sql = query.strip().rstrip(';')
+    if _CONCAT.search(sql):
+        if reject_concat:
+            raise Unsupported("string concatenation with '+' rejected (--reject-concat)")
+        sql = concat_to_pipes(sql)
+    for pattern, repl in _REWRITES:
+        sql = pattern.sub(repl, sql)
+    sql = _INNER_TOP.sub(r'(SELECT \2 LIMIT \1)', sql)
+    m = _TOP.match(sql)
+    if m:
+        sql = 'SELECT ' + sql[m.end():] + f' LIMIT {m.group(1)}'
+    return sql
+
+
+class ChecksumAgg:
+    def __init__(self):
+        self.value = 0
+
+    def step(self, v):
+        self.value ^= v or 0
+
+    def finalize(self):
+        return self.value
+
+
+def binary_checksum(*values):
+    return zlib.crc32(repr(values).encode('utf-8')) - 2 ** 31
+
+
+def connect(path):
+    db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.create_function('GETDATE', 0, lambda: time.strftime('%Y-%m-%d %H:%M:%S'))
+    db.create_function('BINARY_CHECKSUM', -1, binary_checksum)
+    db.create_aggregate('CHECKSUM_AGG', 1, ChecksumAgg)
+    return db
+
+
+class FakeInspectionServer:
+    def __init__(self, db_path, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, seed=None, reject_concat=False):
+        self.db_path = db_path
+        self.reject_concat = reject_concat
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.local = threading.local()
+        self.stats = {'queries': 0, 'errors': 0, 'injected': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/inspection/query'
+
+    def execute(self, query, params):
+        """(status, body dict) for one request."""
+        self.stats['queries'] += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.jitter))
+        roll = self.random.random()
+        if roll < self.error_rate:
+            self.stats['injected'] += 1
+            return 500, {'statusCode': 500, 'message': 'injected failure'}
+        if roll < self.error_rate + self.throttle_rate:
+            self.stats['injected'] += 1
+            return 429, {'statusCode': 429, 'message': 'injected throttle'}
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = connect(self.db_path)
+        try:
+            rows = [dict(r) for r in db.execute(translate(query, self.reject_concat), params or [])]
+        except (Unsupported, sqlite3.Error) as e:
+            self.stats['errors'] += 1
+            return 500, {'statusCode': 500, 'message': f'{type(e).__name__}: {e}'}
+        return 200, {'data': rows}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    status, out = 401, {'statusCode': 401, 'message': 'Unauthorized'}
+                else:
+                    try:
+                        payload = json.loads(body)
+                        status, out = server.execute(payload['query'], payload.get('params'))
+                    except (ValueError, KeyError) as e:
+                        status, out = 400, {'statusCode': 400, 'message': f'bad request: {e}'}
+                data = json.dumps(out, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    data = gzip.compress(data, compresslevel=1)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake /inspection/query endpoint backed by SQLite.')
+    parser.add_argument('--db', required=True, help='SQLite database file')
+    parser.add_argument('--generate', action='store_true', help='(re)generate synthetic data and exit')
+    parser.add_argument('--root', type=int, default=101000)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--stock-rows', type=int, default=10000)
+    parser.add_argument('--notes', type=int)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--reject-concat', action='store_true',
+                        help="answer statements concatenating strings with '+' with a 500 (exercises the fallbacks)")
+    args = parser.parse_args()
+    if args.generate:
+        info = generate_db(args.db, args.root, args.depth, args.fanout, args.products, args.stock_rows, args.notes)
+        print('Generated', args.db, info)
+        return
+    server = FakeInspectionServer(args.db, args.host, args.port, args.latency_ms / 1000, args.jitter_ms / 1000,
+                                  args.error_rate, args.throttle_rate, reject_concat=args.reject_concat)
+    print('Serving', server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('Stats', server.stats)
+
+
+if __name__ == '__main__':
+    main()
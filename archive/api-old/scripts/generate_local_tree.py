@@ -1,167 +1,222 @@
 #!/usr/bin/env python3
-"""Generate tree (pai→...→local) + per-local product aggregates for a given root local.
-Usage: python3 scripts/generate_local_tree.py [ROOT_LOCAL]
-Output: docs/sqls/estoque-locais/tree_{ROOT}.json/.csv/.txt
+"""Generate tree (pai→...→local) + per-local product aggregates for one or more root locals.
+Usage: python3 scripts/generate_local_tree.py [ROOT_LOCAL ...] [--roots-file FILE]
+                                              [--combined NAME] [--rollup] [--no-loc-cache]
+                                              [--incremental [--full]]
+Several roots are processed as one batch: the union of their subtrees is
+discovered once (roots already inside another root's subtree are not fetched
+again), paths and products are fetched once for the union, and every local's
+rows are routed to each root that contains it.
+The location tree is served from the local TGFLOC cache (tgfloc_cache.sqlite);
+--no-loc-cache queries TGFLOC directly instead.
+Output: docs/sqls/estoque-locais/tree_{ROOT}_products.json/.jsonl/.csv/.txt(/.parquet) per root, or with
+--combined NAME a single docs/sqls/estoque-locais/NAME.* with a ROOT_LOCAL column.
+--rollup also writes subtree totals per local and per product (tree_{ROOT}_rollup.*)
+and per-depth subtotals (tree_{ROOT}_depth_totals.*), computed locally.
+--incremental keeps per-local aggregates in stock_snapshot.sqlite and only refetches
+locals with stock movements since the last run; the outputs are rendered from the
+snapshot and the differences are written to tree_{ROOT}_changes.* (NAME_changes.*).
+--full refetches every local but still updates the snapshot and the change set.
+INSPECTION_TRACE=1 records per-query and per-stage timings (see tracing.py).
 """
-import json
-import subprocess
-import sys
-import time
+import argparse
+from contextlib import ExitStack
 from pathlib import Path
 
-ROOT = int(sys.argv[1]) if len(sys.argv) > 1 else 101000
+import loc_paths
+import stock_queries
+import stock_snapshot
+from inspection_client import client_from_base
+from loc_cache import LocationCache
+from loc_paths import PATH_KEYS
+from report_writers import ReportWriter, write_report
+from row_model import ROW_FIELDS, RowModel
+from stock_rollup import DEPTH_FIELDS, LOCATION_FIELDS, StockRollup
+from stock_snapshot import CHANGE_FIELDS, StockSnapshot
+from tracing import stage
+
+parser = argparse.ArgumentParser(description='Location tree + per-local product aggregates.')
+parser.add_argument('roots', nargs='*', type=int, help='root CODLOCALs (default 101000)')
+parser.add_argument('--roots-file', type=Path, help='file with root CODLOCALs, one per line (# comments allowed)')
+parser.add_argument('--combined', metavar='NAME', help='write one output partitioned by ROOT_LOCAL instead of one per root')
+parser.add_argument('--rollup', action='store_true', help='also write subtree and per-depth stock totals')
+parser.add_argument('--no-loc-cache', action='store_true', help='query TGFLOC directly instead of the local cache')
+parser.add_argument('--incremental', action='store_true', help='only refetch locals with stock movements since the last run')
+parser.add_argument('--full', action='store_true', help='with --incremental, refetch every local')
+ARGS = parser.parse_args()
+
+ROOTS = list(ARGS.roots)
+if ARGS.roots_file:
+    for line in ARGS.roots_file.read_text().splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            ROOTS.append(int(line))
+ROOTS = list(dict.fromkeys(ROOTS)) or [101000]
+USE_LOC_CACHE = not ARGS.no_loc_cache
 BASE = Path('docs/sqls/estoque-locais')
 BASE.mkdir(parents=True, exist_ok=True)
-TOKEN = Path(BASE / 'auth_token.txt').read_text().strip()
+CLIENT = client_from_base(BASE)
+
+def outermost_roots(roots, cache=None):
+    """ROOTS minus those inside another requested root's subtree, whatever the order given.
+    Ancestry comes from the TGFLOC cache, else from one batched ancestors lookup."""
+    if len(roots) < 2:
+        return list(roots)
+    known = {r: cache.path(r) for r in roots} if cache else {}
+    if all(known.values()) and known:
+        chains = {r: [int(c) for c in known[r]['LOCAL_PATH_CODES'].split('.')] for r in roots}
+    else:
+        parent = {r['CODLOCAL']: r.get('CODLOCALPAI') for r in stock_queries.fetch_ancestors(CLIENT, roots)}
+        chains = {}
+        for r in roots:
+            chain, cod = [], r
+            while cod and cod not in chain:
+                chain.append(cod)
+                cod = parent.get(cod)
+            chains[r] = chain
+    wanted = set(roots)
+    return [r for r in roots if not any(c in wanted and c != r for c in chains[r])]
 
-# 1) discover descendants (downwards)
-def discover_descendants(root):
-    seen = set([root])
-    frontier = {root}
+# 1) discover descendants (downwards) for every root: TGFLOC cache, else one
+# recursive-CTE query per root with chunked BFS as fallback
+def discover_descendants(roots):
     nodes = {}
-    while frontier:
-        in_list = ','.join(str(x) for x in sorted(frontier))
-        q = f"SELECT CODLOCAL, CODLOCALPAI, LTRIM(RTRIM(DESCRLOCAL)) AS DESCRLOCAL FROM [SANKHYA].[TGFLOC] WHERE CODLOCALPAI IN ({in_list}) ORDER BY CODLOCAL;"
-        resp = call_inspection(q)
-        data = resp.get('data', [])
-        new_frontier = set()
-        for r in data:
-            nodes[r['CODLOCAL']] = r
-            if r['CODLOCAL'] not in seen:
-                seen.add(r['CODLOCAL'])
-                new_frontier.add(r['CODLOCAL'])
-        frontier = new_frontier
-    # include root
-    root_row = call_inspection(f"SELECT CODLOCAL, CODLOCALPAI, LTRIM(RTRIM(DESCRLOCAL)) AS DESCRLOCAL FROM [SANKHYA].[TGFLOC] WHERE CODLOCAL = {root};").get('data', [])[0]
-    nodes[root] = root_row
+    cache = None
+    if USE_LOC_CACHE:
+        cache = LocationCache(BASE / 'tgfloc_cache.sqlite', CLIENT)
+        cache.refresh()
+        if any(cache.path(r) is None for r in roots):
+            cache.refresh(force=True)
+    for root in outermost_roots(roots, cache):
+        sub = cache.subtree(root) if cache else {}
+        if not sub:
+            sub = stock_queries.discover_descendants(CLIENT, root)
+        nodes.update(sub)
+    if cache:
+        cache.close()
     return nodes
 
-# wrapper for calling inspection/query
-def call_inspection(query):
-    cmd = [
-        'curl','-s','-X','POST','https://api-dbexplorer-nestjs-production.gigantao.net/inspection/query',
-        '-H','accept: application/json',
-        '-H', f'Authorization: Bearer {TOKEN}',
-        '-H','Content-Type: application/json',
-        '-d', json.dumps({'query': query, 'params': []})
-    ]
-    tries = 0
-    while tries < 4:
-        p = subprocess.run(cmd, capture_output=True, text=True)
-        try:
-            r = json.loads(p.stdout)
-            if r.get('statusCode') == 500:
-                raise ValueError('500')
-            return r
-        except Exception:
-            tries += 1
-            time.sleep(1 + tries)
-    return {}
-
-# 2) build paths (walk up parents)
+# 2) build paths: memoized per ancestor, missing ancestors prefetched in one batch
 def build_paths(nodes):
-    parent_map = {}
-    for n in nodes.values():
-        pid = n.get('CODLOCALPAI')
-        if pid and pid not in nodes and pid not in parent_map and pid != 0:
-            parent_map[pid] = None
-    # fetch missing parents
-    if parent_map:
-        in_list = ','.join(str(x) for x in parent_map.keys())
-        resp = call_inspection(f"SELECT CODLOCAL, CODLOCALPAI, LTRIM(RTRIM(DESCRLOCAL)) AS DESCRLOCAL FROM [SANKHYA].[TGFLOC] WHERE CODLOCAL IN ({in_list});")
-        for r in resp.get('data', []):
-            parent_map[r['CODLOCAL']] = r
-    # now assemble paths
-    out = {}
-    for cod, row in nodes.items():
-        parts = [row['DESCRLOCAL']]
-        codes = [str(cod)]
-        depth = 0
-        parent = row.get('CODLOCALPAI')
-        while parent and parent != 0:
-            p = nodes.get(parent) or parent_map.get(parent)
-            if not p:
-                break
-            parts.insert(0, p['DESCRLOCAL'])
-            codes.insert(0, str(p['CODLOCAL']))
-            parent = p.get('CODLOCALPAI')
-            depth += 1
-        out[cod] = {'CODLOCAL': cod, 'DESCRLOCAL': row['DESCRLOCAL'], 'LOCAL_PATH': ' > '.join(parts), 'LOCAL_PATH_CODES': '.'.join(codes), 'LOCAL_DEPTH': depth}
-    return out
-
-# 3) fetch per-local aggregated products in a single query
+    if nodes and all('LOCAL_PATH' in n for n in nodes.values()):
+        # already materialized server-side (recursive CTE) or by the TGFLOC cache
+        return {cod: {k: n[k] for k in PATH_KEYS} for cod, n in nodes.items()}
+    return loc_paths.build_paths(nodes, lambda ids: stock_queries.fetch_ancestors(CLIENT, ids))
 
+# 3) fetch per-local aggregated products: keyset-paged, consumed batch by batch
 def fetch_products_for_nodes(cod_list):
-    if not cod_list:
-        return []
-    in_list = ','.join(str(x) for x in sorted(cod_list))
-    q = f"SELECT P.CODPROD, LTRIM(RTRIM(P.DESCRPROD)) AS DESCRPROD, LTRIM(RTRIM(P.UNIDADE)) AS UNIDADE, LTRIM(RTRIM(P.MARCA)) AS MARCA, P.NCM, E.CODLOCAL, SUM(ISNULL(E.ESTOQUE,0)) AS TOTAL_ESTOQUE FROM [SANKHYA].[TGFEST] E JOIN [SANKHYA].[TGFPRO] P ON P.CODPROD = E.CODPROD WHERE E.CODLOCAL IN ({in_list}) GROUP BY P.CODPROD, P.DESCRPROD, P.UNIDADE, P.MARCA, P.NCM, E.CODLOCAL ORDER BY E.CODLOCAL, P.DESCRPROD;"
-    resp = call_inspection(q)
-    return resp.get('data', [])
+    """Generator of row batches ordered by (CODLOCAL, CODPROD)."""
+    return stock_queries.iter_product_batches(CLIENT, cod_list)
 
 # run
-nodes = discover_descendants(ROOT)
-paths = build_paths(nodes)
-products = fetch_products_for_nodes(nodes.keys())
-
-# assemble rows
-rows = []
-prod_by_local = {}
-for p in products:
-    prod_by_local.setdefault(p['CODLOCAL'], []).append(p)
-
-for cod, info in sorted(paths.items()):
-    prods = prod_by_local.get(cod, [])
-    if not prods:
-        rows.append({
-            'CODLOCAL': cod,
-            'DESCRLOCAL': info['DESCRLOCAL'],
-            'LOCAL_PATH': info['LOCAL_PATH'],
-            'LOCAL_PATH_CODES': info['LOCAL_PATH_CODES'],
-            'LOCAL_DEPTH': info['LOCAL_DEPTH'],
-            'CODPROD': None,
-            'DESCRPROD': None,
-            'TOTAL_ESTOQUE': 0
-        })
+with stage('discover', roots=len(ROOTS)) as s:
+    nodes = discover_descendants(ROOTS)
+    s['locals'] = len(nodes)
+with stage('paths'):
+    paths = build_paths(nodes)
+changes = None
+if ARGS.incremental:
+    # delta against the snapshot, then every local is served from it
+    snapshot = StockSnapshot(BASE / 'stock_snapshot.sqlite')
+    with stage('products_delta') as s:
+        refetched, changes = stock_snapshot.sync(CLIENT, snapshot, nodes.keys(), full=ARGS.full)
+        s.update(refetched=len(refetched), changes=len(changes))
+    print('Refetched', len(refetched), 'of', len(nodes), 'locals;', len(changes), 'changes')
+    groups = snapshot.iter_groups(paths.keys())
+else:
+    groups = stock_queries.iter_products_by_local(fetch_products_for_nodes(nodes.keys()))
+
+# assemble rows (merged with the product stream, generated lazily and streamed to the writers)
+FIELDS = sorted(ROW_FIELDS)
+model = RowModel(paths)
+
+def iter_rows():
+    """(CODLOCAL, row) for every local of the union, ordered by CODLOCAL."""
+    group_cod, group = next(groups, (None, []))
+    for cod, loc in model.locations():
+        # both streams are ordered by CODLOCAL
+        while group_cod is not None and group_cod < cod:
+            group_cod, group = next(groups, (None, []))
+        prods = group if group_cod == cod else []
+        if not prods:
+            yield cod, model.empty_row(loc)
+        else:
+            for pr in prods:
+                yield cod, model.stock_row(loc, pr)
+
+# roots containing each local (a local under nested roots belongs to all of them)
+root_set = set(ROOTS)
+roots_of = {cod: [int(c) for c in info['LOCAL_PATH_CODES'].split('.') if int(c) in root_set]
+            for cod, info in paths.items()}
+
+def tracked_rows():
+    """iter_rows(), feeding the roll-up as rows stream by."""
+    for cod, row in iter_rows():
+        if rollup:
+            rollup.add(cod, row['CODPROD'], row['TOTAL_ESTOQUE'])
+        yield cod, row
+
+rollup = StockRollup(paths) if ARGS.rollup else None
+
+# outputs (.json/.jsonl/.csv/.txt); some rows lack UNIDADE/MARCA/NCM, so columns are fixed up front
+# (product pages are fetched lazily while rows are written, so both share one stage)
+if ARGS.combined:
+    with stage('products+write') as s:
+        with ReportWriter(BASE / ARGS.combined, ['ROOT_LOCAL'] + FIELDS) as writer:
+            for cod, row in tracked_rows():
+                for root in roots_of[cod]:
+                    writer.write({'ROOT_LOCAL': root, **row})
+        s['rows'] = writer.count
+    print('Wrote', *writer.paths, 'rows:', writer.count)
+else:
+    with stage('products+write') as s:
+        # a failure drops every root's partial output (see ReportWriter.__exit__)
+        with ExitStack() as stack:
+            writers = {root: stack.enter_context(ReportWriter(BASE / f'tree_{root}_products', FIELDS))
+                       for root in ROOTS}
+            for cod, row in tracked_rows():
+                for root in roots_of[cod]:
+                    writers[root].write(row)
+        s['rows'] = sum(w.count for w in writers.values())
+    for w in writers.values():
+        print('Wrote', *w.paths, 'rows:', w.count)
+
+# roll-up: subtree totals are the same whichever root a local is reported under
+if rollup:
+    with stage('rollup'):
+        rollup.compute()
+    members = {root: [cod for cod in paths if root in roots_of[cod]] for root in ROOTS}
+    if ARGS.combined:
+        outputs = [
+            (f'{ARGS.combined}_rollup', ['ROOT_LOCAL'] + LOCATION_FIELDS,
+             ({'ROOT_LOCAL': root, **r} for root in ROOTS for r in rollup.iter_location_rows(members[root]))),
+            (f'{ARGS.combined}_depth_totals', ['ROOT_LOCAL'] + DEPTH_FIELDS,
+             ({'ROOT_LOCAL': root, **r} for root in ROOTS for r in rollup.iter_depth_rows(members[root]))),
+        ]
+    else:
+        outputs = []
+        for root in ROOTS:
+            outputs.append((f'tree_{root}_rollup', LOCATION_FIELDS, rollup.iter_location_rows(members[root])))
+            outputs.append((f'tree_{root}_depth_totals', DEPTH_FIELDS, rollup.iter_depth_rows(members[root])))
+    for name, fields, rows in outputs:
+        w = write_report(BASE / name, rows, fields)
+        print('Wrote', *w.paths, 'rows:', w.count)
+
+# change set of an incremental run, with the local's path for context
+if changes is not None:
+    def change_rows(root):
+        for c in changes:
+            if root in roots_of.get(c['CODLOCAL'], ()):
+                info = paths[c['CODLOCAL']]
+                yield {**c, 'LOCAL_PATH': info['LOCAL_PATH'], 'LOCAL_DEPTH': info['LOCAL_DEPTH']}
+
+    change_fields = CHANGE_FIELDS[:1] + ['LOCAL_PATH', 'LOCAL_DEPTH'] + CHANGE_FIELDS[1:]
+    if ARGS.combined:
+        outputs = [(f'{ARGS.combined}_changes', ['ROOT_LOCAL'] + change_fields,
+                    ({'ROOT_LOCAL': root, **r} for root in ROOTS for r in change_rows(root)))]
     else:
-        for pr in prods:
-            rows.append({
-                'CODLOCAL': cod,
-                'DESCRLOCAL': info['DESCRLOCAL'],
-                'LOCAL_PATH': info['LOCAL_PATH'],
-                'LOCAL_PATH_CODES': info['LOCAL_PATH_CODES'],
-                'LOCAL_DEPTH': info['LOCAL_DEPTH'],
-                'CODPROD': pr.get('CODPROD'),
-                'DESCRPROD': pr.get('DESCRPROD'),
-                'UNIDADE': pr.get('UNIDADE'),
-                'MARCA': pr.get('MARCA'),
-                'NCM': pr.get('NCM'),
-                'TOTAL_ESTOQUE': pr.get('TOTAL_ESTOQUE')
-            })
-
-# outputs
-out_json = BASE / f'tree_{ROOT}_products.json'
-out_csv = BASE / f'tree_{ROOT}_products.csv'
-out_txt = BASE / f'tree_{ROOT}_products.txt'
-out_json.write_text(json.dumps(rows, ensure_ascii=False, indent=2))
-import csv
-# determine full set of columns (some rows have UNIDADE/MARCA/NCM, others not)
-all_keys = set()
-for r in rows:
-    all_keys.update(r.keys())
-fieldnames = sorted(all_keys)
-with out_csv.open('w', newline='') as f:
-    if rows:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-with out_txt.open('w') as f:
-    if rows:
-        headers = fieldnames
-        widths = {h: max(len(h), max((len(str(r.get(h,''))) for r in rows))) for h in headers}
-        f.write(' | '.join(h.ljust(widths[h]) for h in headers) + '\n')
-        f.write('-+-'.join('-'*widths[h] for h in headers) + '\n')
-        for r in rows:
-            f.write(' | '.join(str(r.get(h,'')).ljust(widths[h]) for h in headers) + '\n')
-
-print('Wrote', out_json, out_csv, out_txt, 'rows:', len(rows))
+        outputs = [(f'tree_{root}_changes', change_fields, change_rows(root)) for root in ROOTS]
+    for name, fields, rows in outputs:
+        w = write_report(BASE / name, rows, fields)
+        print('Wrote', *w.paths, 'rows:', w.count)
+    snapshot.close()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Pooled HTTP client for the /inspection/query endpoint.
+Keeps HTTPS connections alive between queries (no curl fork/exec, no new TLS
+handshake per query), asks for gzip responses and applies separate connect/read
+timeouts. Successful responses can be served from a QueryCache (query_cache.py).
+Failures raise the typed errors of resilience.py after jittered exponential
+backoff; in-flight requests are capped adaptively and a circuit breaker holds
+callers while the endpoint is down. Every call is reported to the tracer of
+tracing.py (a no-op unless INSPECTION_TRACE is set). Safe to share between threads.
+Usage:
+    from inspection_client import client_from_base
+    client = client_from_base(BASE)
+    rows = client.query("SELECT ...").get('data', [])
+"""
+import gzip
+import http.client
+import json
+import os
+import queue
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import tracing
+from query_cache import QueryCache
+from resilience import (RETRYABLE, AdaptiveLimiter, AuthError, CircuitBreaker, InspectionError, QueryRejected,
+                        RetryPolicy, ServerError, ThrottledError, TransportError, parse_retry_after)
+
+DEFAULT_URL = os.environ.get(
+    'INSPECTION_URL', 'https://api-dbexplorer-nestjs-production.gigantao.net/inspection/query')
+
+# errors raised by a keep-alive connection the server already closed
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                BrokenPipeError, ConnectionResetError)
+
+
+class InspectionClient:
+    def __init__(self, token, url=DEFAULT_URL, pool_size=8, connect_timeout=10.0,
+                 read_timeout=120.0, retries=4, cache=None, breaker=None, tracer=None):
+        parts = urlsplit(url)
+        self.token = token
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or '/'
+        self.https = parts.scheme == 'https'
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.policy = RetryPolicy(retries)
+        self.limiter = AdaptiveLimiter(pool_size)
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+        self.tracer = tracer or tracing.TRACER
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    # -- connection pool
+    def _new_conn(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_conn(), False
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- requests
+    def post(self, payload):
+        """POST a JSON payload; returns (status, headers, decoded body bytes)."""
+        body = json.dumps(payload).encode('utf-8')
+        headers = {
+            'accept': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'Authorization': f'Bearer {self.token}',
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive',
+        }
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request('POST', self.path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except STALE_ERRORS:
+                conn.close()
+                if reused:
+                    continue  # idle connection was dropped by the server, retry on a fresh one
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if resp.getheader('Content-Encoding', '').lower() == 'gzip':
+                data = gzip.decompress(data)
+            return resp.status, dict(resp.getheaders()), data
+
+    def query(self, query, params=None, use_cache=True, retries=None):
+        """Run a query and return the parsed response.
+        Raises QueryRejected/AuthError right away, and ServerError/TransportError/
+        ThrottledError once retries are exhausted (CircuitOpenError on a long outage).
+        USE_CACHE=False bypasses the cache for reads that must be fresh (and does
+        not store them, nothing would read them back); RETRIES overrides the
+        policy's attempt count (e.g. 1 for probes)."""
+        started = time.perf_counter()
+        if self.cache and use_cache:
+            hit = self.cache.get(query, params)
+            if hit is not None:
+                self.tracer.query(query, started, cache_hit=True, rows=len(hit.get('data') or []))
+                return hit
+        stats = {'attempts': 0, 'bytes': 0}
+        try:
+            r = self._query(query, params, self.policy.retries if retries is None else retries, stats)
+        except InspectionError as e:
+            self.tracer.query(query, started, error=type(e).__name__, status=e.status, **stats)
+            raise
+        self.tracer.query(query, started, rows=len(r.get('data') or []), **stats)
+        if self.cache and use_cache and isinstance(r.get('data'), list):
+            self.cache.put(query, params, r)
+        return r
+
+    def _query(self, query, params, retries, stats):
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            self.limiter.acquire()
+            overloaded = False
+            stats['attempts'] += 1
+            try:
+                return self._attempt(query, params, stats)
+            except RETRYABLE as e:
+                overloaded = isinstance(e, (ServerError, ThrottledError))
+                self.breaker.record(ok=False)
+                attempt += 1
+                if attempt >= retries:
+                    raise
+                error = e
+            except QueryRejected:
+                self.breaker.record(ok=True)  # the endpoint answered; the statement was at fault
+                raise
+            finally:
+                self.limiter.release(overloaded)
+            time.sleep(self.policy.delay(attempt, error))
+
+    def _attempt(self, query, params, stats):
+        """One POST, classified into a response dict or a typed InspectionError."""
+        try:
+            status, headers, data = self.post({'query': query, 'params': params or []})
+        except (OSError, http.client.HTTPException) as e:
+            raise TransportError(f'{type(e).__name__}: {e}', query=query) from e
+        stats['bytes'] += len(data)
+        try:
+            r = json.loads(data)
+        except ValueError as e:
+            if status >= 500:
+                raise ServerError(f'HTTP {status}', status, query) from e
+            raise TransportError(f'HTTP {status}: unparseable response {data[:200]!r}', status, query) from e
+        code = (r.get('statusCode') if isinstance(r, dict) else None) or status
+        if code < 400 and isinstance(r, dict):
+            self.breaker.record(ok=True)
+            return r
+        message = f"HTTP {code}: {r.get('message') if isinstance(r, dict) else str(r)[:200]}"
+        if code == 429:
+            raise ThrottledError(message, code, query, parse_retry_after(headers.get('Retry-After')))
+        if code >= 500 or code < 400:
+            raise ServerError(message, code, query)
+        if code in (401, 403):
+            raise AuthError(message, code, query)
+        raise QueryRejected(message, code, query)
+
+
+def client_from_base(base, cache=True, **kwargs):
+    """Build a client using the token stored in BASE/auth_token.txt.
+    Responses are cached in BASE/query_cache.sqlite unless CACHE is False or
+    INSPECTION_CACHE=0 is set in the environment."""
+    token = Path(base, 'auth_token.txt').read_text().strip()
+    if cache and os.environ.get('INSPECTION_CACHE', '1') != '0':
+        kwargs['cache'] = QueryCache(Path(base, 'query_cache.sqlite'))
+    return InspectionClient(token, **kwargs)
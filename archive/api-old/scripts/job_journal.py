@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Append-only journal of completed queries, so an interrupted job can resume.
+Every response is appended (and flushed) as one JSON line keyed by the query
+hash (query_cache.cache_key) as soon as it arrives. A re-run with resume=True
+loads the journal and answers already-completed queries from it without touching
+the endpoint or the rate limiter; a torn last line from a crash is cut off
+before new records are appended.
+Without resume the journal starts empty. finish() deletes it once the job has
+written its outputs, so a later --resume never replays a finished job.
+Usage:
+    journal = JobJournal(BASE / 'journals' / 'descendants_products_report.jsonl', resume=ARGS.resume)
+    executor = QueryExecutor(client, journal=journal)
+    ...
+    journal.finish()
+"""
+import json
+import threading
+from pathlib import Path
+
+from query_cache import cache_key
+
+
+class JobJournal:
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.done = {}
+        self.hits = 0
+        self.lock = threading.Lock()
+        if resume and self.path.exists():
+            with self.path.open('r+b') as f:
+                end = 0  # offset after the last complete line
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # torn write from an interrupted run
+                    end += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done[entry['key']] = entry['response']
+                # cut the torn tail, or the first new record would be glued onto it
+                f.truncate(end)
+        self.file = self.path.open('a' if resume else 'w', encoding='utf-8')
+        if resume:
+            print(f'Resuming from {self.path}: {len(self.done)} queries already done')
+
+    def get(self, query, params=None):
+        r = self.done.get(cache_key(query, params))
+        if r is not None:
+            with self.lock:
+                self.hits += 1
+        return r
+
+    def record(self, query, params, response):
+        key = cache_key(query, params)
+        line = json.dumps({'key': key, 'response': response}, ensure_ascii=False, default=str)
+        with self.lock:
+            self.done[key] = response
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def finish(self):
+        """The job completed: drop the journal."""
+        self.close()
+        self.path.unlink(missing_ok=True)
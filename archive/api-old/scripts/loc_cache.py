@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""On-disk SQLite cache of the TGFLOC location hierarchy.
+Stores CODLOCAL/CODLOCALPAI/DESCRLOCAL with precomputed LOCAL_PATH,
+LOCAL_PATH_CODES, LOCAL_DEPTH and an ancestor/descendant closure table, so
+subtree and path lookups for any root are answered locally.
+Refresh is gated by a TTL and then by a server-side checksum of TGFLOC: the
+table is only downloaded again when the checksum changed.
+Usage:
+    from loc_cache import LocationCache
+    cache = LocationCache(BASE / 'tgfloc_cache.sqlite', client)
+    cache.refresh()
+    nodes = cache.subtree(101000)
+"""
+import sqlite3
+import time
+
+from loc_paths import resolve_paths
+from resilience import InspectionError
+
+DEFAULT_TTL = 6 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loc (
+    CODLOCAL INTEGER PRIMARY KEY,
+    CODLOCALPAI INTEGER,
+    DESCRLOCAL TEXT,
+    LOCAL_DEPTH INTEGER,
+    LOCAL_PATH TEXT,
+    LOCAL_PATH_CODES TEXT
+);
+CREATE INDEX IF NOT EXISTS loc_pai ON loc (CODLOCALPAI);
+CREATE TABLE IF NOT EXISTS closure (
+    ANCESTOR INTEGER NOT NULL,
+    DESCENDANT INTEGER NOT NULL,
+    DIST INTEGER NOT NULL,
+    PRIMARY KEY (ANCESTOR, DESCENDANT)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS closure_desc ON closure (DESCENDANT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+CHECKSUM_QUERY = "SELECT COUNT(*) AS N, CHECKSUM_AGG(BINARY_CHECKSUM(CODLOCAL, CODLOCALPAI, DESCRLOCAL)) AS CK FROM [SANKHYA].[TGFLOC];"
+FULL_QUERY = "SELECT CODLOCAL, CODLOCALPAI, LTRIM(RTRIM(DESCRLOCAL)) AS DESCRLOCAL FROM [SANKHYA].[TGFLOC] ORDER BY CODLOCAL;"
+ROW_COLUMNS = ('CODLOCAL', 'CODLOCALPAI', 'DESCRLOCAL', 'LOCAL_DEPTH', 'LOCAL_PATH', 'LOCAL_PATH_CODES')
+
+
+def compute_hierarchy(rows):
+    """Paths and closure for every row.
+    Returns ({cod: (LOCAL_PATH, LOCAL_PATH_CODES, LOCAL_DEPTH)}, [(ancestor, descendant, dist)])."""
+    resolved = resolve_paths({r['CODLOCAL']: r for r in rows})
+    closure = []
+    for cod, (_, codes, depth) in resolved.items():
+        closure.extend((int(anc), cod, depth - i) for i, anc in enumerate(codes.split('.')))
+    return resolved, closure
+
+
+class LocationCache:
+    def __init__(self, path, client=None, ttl=DEFAULT_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.db = sqlite3.connect(str(path))
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def _meta(self, key, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, **kv):
+        self.db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                            [(k, str(v)) for k, v in kv.items()])
+
+    def is_empty(self):
+        return self.db.execute('SELECT 1 FROM loc LIMIT 1').fetchone() is None
+
+    def refresh(self, force=False):
+        """Reload TGFLOC if stale; returns True when the table was downloaded again."""
+        now = time.time()
+        if not force and not self.is_empty() and now - float(self._meta('checked_at', 0)) < self.ttl:
+            return False
+        try:
+            data = self.client.query(CHECKSUM_QUERY, use_cache=False).get('data') or [{}]
+            checksum = f"{data[0].get('N')}:{data[0].get('CK')}"
+            if not force and not self.is_empty() and checksum == self._meta('checksum'):
+                with self.db:
+                    self._set_meta(checked_at=now)
+                return False
+            rows = self.client.query(FULL_QUERY, use_cache=False).get('data', [])
+        except InspectionError as e:
+            if self.is_empty():
+                raise
+            print('TGFLOC refresh failed, using cached snapshot:', e)
+            return False
+        if not rows:
+            return False  # keep the previous snapshot rather than wiping it on a failed fetch
+        self.load(rows, checksum=checksum, checked_at=now)
+        return True
+
+    def load(self, rows, **meta):
+        """Replace the cached hierarchy with ROWS (CODLOCAL, CODLOCALPAI, DESCRLOCAL)."""
+        resolved, closure = compute_hierarchy(rows)
+        with self.db:
+            self.db.execute('DELETE FROM loc')
+            self.db.execute('DELETE FROM closure')
+            self.db.executemany(
+                'INSERT INTO loc VALUES (?, ?, ?, ?, ?, ?)',
+                ((r['CODLOCAL'], r.get('CODLOCALPAI'), r['DESCRLOCAL'], resolved[r['CODLOCAL']][2],
+                  resolved[r['CODLOCAL']][0], resolved[r['CODLOCAL']][1])
+                 for r in rows))
+            self.db.executemany('INSERT INTO closure VALUES (?, ?, ?)', closure)
+            self._set_meta(**meta)
+
+    def path(self, cod):
+        row = self.db.execute(f"SELECT {', '.join(ROW_COLUMNS)} FROM loc WHERE CODLOCAL = ?", (cod,)).fetchone()
+        return dict(row) if row else None
+
+    def subtree(self, root):
+        """ROOT and all its descendants keyed by CODLOCAL (rows carry paths and depth)."""
+        cols = ', '.join(f'L.{c}' for c in ROW_COLUMNS)
+        cur = self.db.execute(
+            f"SELECT {cols} FROM closure C JOIN loc L ON L.CODLOCAL = C.DESCENDANT "
+            "WHERE C.ANCESTOR = ? ORDER BY L.CODLOCAL", (root,))
+        return {r['CODLOCAL']: dict(r) for r in cur}
+
+    def ancestors(self, cod):
+        """Ancestors of COD from the top down (COD itself excluded)."""
+        cols = ', '.join(f'L.{c}' for c in ROW_COLUMNS)
+        cur = self.db.execute(
+            f"SELECT {cols} FROM closure C JOIN loc L ON L.CODLOCAL = C.ANCESTOR "
+            "WHERE C.DESCENDANT = ? AND C.DIST > 0 ORDER BY C.DIST DESC", (cod,))
+        return [dict(r) for r in cur]
+
+    def close(self):
+        self.db.close()
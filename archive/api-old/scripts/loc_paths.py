@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Ancestor-path engine for TGFLOC rows.
+Each location's LOCAL_PATH/LOCAL_PATH_CODES/LOCAL_DEPTH is computed once and
+reused by all of its descendants, so a whole tree assembles in linear time
+instead of walking every node up to the root. Missing ancestors are fetched in
+one batched step before assembly; loops in CODLOCALPAI are detected and cut.
+"""
+
+PATH_KEYS = ('CODLOCAL', 'DESCRLOCAL', 'LOCAL_PATH', 'LOCAL_PATH_CODES', 'LOCAL_DEPTH')
+
+
+def resolve_paths(rows):
+    """{cod: (LOCAL_PATH, LOCAL_PATH_CODES, LOCAL_DEPTH)} for every row in ROWS ({cod: row}).
+    A parent missing from ROWS ends the path; a cycle is cut where it closes."""
+    memo = {}
+    for start in rows:
+        if start in memo:
+            continue
+        # walk up until an already-resolved ancestor, the top, or a cycle
+        chain = []
+        on_chain = set()
+        cod = start
+        while cod in rows and cod not in memo and cod not in on_chain:
+            chain.append(cod)
+            on_chain.add(cod)
+            pai = rows[cod].get('CODLOCALPAI')
+            cod = pai if pai and pai != cod else None
+        if cod in on_chain:
+            print('cycle in TGFLOC.CODLOCALPAI at', cod)
+            parent = None
+        else:
+            parent = memo.get(cod)
+        # then resolve the chain top-down, each node from its parent's result
+        for c in reversed(chain):
+            descr = rows[c]['DESCRLOCAL']
+            if parent is None:
+                parent = (descr, str(c), 0)
+            else:
+                parent = (f'{parent[0]} > {descr}', f'{parent[1]}.{c}', parent[2] + 1)
+            memo[c] = parent
+    return memo
+
+
+def missing_parents(rows):
+    return {r['CODLOCALPAI'] for r in rows.values()
+            if r.get('CODLOCALPAI') and r['CODLOCALPAI'] not in rows}
+
+
+def build_paths(nodes, fetch_ancestors=None):
+    """Path rows (PATH_KEYS) for every node in NODES ({cod: row}).
+    FETCH_ANCESTORS(ids) -> rows is called once with every parent not in NODES and
+    must return those rows plus their own ancestors (see stock_queries.fetch_ancestors)."""
+    rows = dict(nodes)
+    missing = missing_parents(rows)
+    if missing and fetch_ancestors:
+        for r in fetch_ancestors(missing):
+            rows.setdefault(r['CODLOCAL'], r)
+    resolved = resolve_paths(rows)
+    out = {}
+    for cod, row in nodes.items():
+        path, codes, depth = resolved[cod]
+        out[cod] = {'CODLOCAL': cod, 'DESCRLOCAL': row['DESCRLOCAL'], 'LOCAL_PATH': path,
+                    'LOCAL_PATH_CODES': codes, 'LOCAL_DEPTH': depth}
+    return out
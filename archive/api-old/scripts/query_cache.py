@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Disk cache of /inspection/query responses for InspectionClient.
+Entries are keyed by the normalized query text (whitespace collapsed outside
+string literals, trailing ';' dropped) plus the bound params, expire after a TTL
+chosen by the tables the query reads, and are evicted (expired first, then
+least-recently-used) once the stored bytes, tracked as a running total, exceed a
+budget. Hit/miss counters are kept in `stats`.
+"""
+import gzip
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# seconds; a query gets the shortest TTL among the tables it touches
+TABLE_TTLS = {
+    'TGFLOC': 24 * 3600,
+    'TGFPRO': 24 * 3600,
+    'TGFPAR': 24 * 3600,
+    'TGFITE': 3600,
+    'TGFCAB': 3600,
+    'TGFEST': 15 * 60,
+}
+DEFAULT_TTL = 5 * 60
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_expiry ON entries (expires_at);
+"""
+
+_TOKENS = re.compile(r"('(?:[^']|'')*')|(\s+)")
+_TABLES = re.compile(r"(?:FROM|JOIN)\s+(?:\[?\w+\]?\.)?\[?(\w+)\]?", re.IGNORECASE)
+
+
+def normalize_query(query):
+    """Collapse whitespace outside string literals and drop the trailing ';'."""
+    out = _TOKENS.sub(lambda m: m.group(1) or ' ', query.strip())
+    return out.rstrip('; ')
+
+
+def query_ttl(query):
+    tables = {t.upper() for t in _TABLES.findall(query)}
+    return min((TABLE_TTLS.get(t, DEFAULT_TTL) for t in tables), default=DEFAULT_TTL)
+
+
+def cache_key(query, params=None):
+    raw = normalize_query(query) + '\x00' + json.dumps(params or [], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class QueryCache:
+    def __init__(self, path, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        # stored bytes, kept up to date by put/_evict instead of re-summed on every store
+        self.total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def get(self, query, params=None):
+        """Cached response dict, or None on a miss/expired entry."""
+        key = cache_key(query, params)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT body, expires_at FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or row[1] < now:
+                self.stats['misses'] += 1
+                return None
+            with self.db:
+                self.db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            self.stats['hits'] += 1
+        return json.loads(gzip.decompress(row[0]))
+
+    def put(self, query, params, response, ttl=None):
+        body = gzip.compress(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        ttl = query_ttl(query) if ttl is None else ttl
+        key = cache_key(query, params)
+        with self.lock, self.db:
+            old = self.db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                            (key, body, len(body), now + ttl, now))
+            self.total += len(body) - (old[0] if old else 0)
+            self.stats['stores'] += 1
+            if self.total > self.budget:
+                self._evict(now)
+
+    def _evict(self, now):
+        """Drop expired entries, then least-recently-used ones until within budget."""
+        expired = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries WHERE expires_at < ?', (now,)).fetchone()[0]
+        self.db.execute('DELETE FROM entries WHERE expires_at < ?', (now,))
+        self.total -= expired
+        if self.total <= self.budget:
+            return
+        for key, size in self.db.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall():
+            self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.stats['evictions'] += 1
+            self.total -= size
+            if self.total <= self.budget:
+                break
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM entries')
+            self.total = 0
+
+    def close(self):
+        self.db.close()
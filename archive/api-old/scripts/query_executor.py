@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Concurrent fan-out of independent /inspection/query calls.
+Runs queries on a bounded thread pool sharing one InspectionClient, throttles
+requests per host and returns results in submission order. With a JobJournal
+(job_journal.py) completed queries are answered from it before the rate limiter
+and new responses are recorded as they arrive.
+Usage:
+    from query_executor import run_queries
+    responses = run_queries(client, [q1, q2, ...], max_workers=8, rate=20)
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` requests per second, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def limit(self, rate):
+        """Lower the rate to RATE in place (tokens already earned are kept, up to the new burst)."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = float(rate)
+            self.capacity = min(self.capacity, float(max(1, rate)))
+            self.tokens = min(self.tokens, self.capacity)
+
+
+# one limiter per host, shared by every executor in the process; when executors ask
+# for different rates the lowest one applies to all of them
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def host_limiter(host, rate):
+    with _limiters_lock:
+        lim = _limiters.get(host)
+        if lim is None:
+            lim = _limiters[host] = RateLimiter(rate)
+        elif rate < lim.rate:
+            lim.limit(rate)
+        return lim
+
+
+class QueryExecutor:
+    """Thread pool bound to a client; `rate` is requests/second per host (None = unthrottled)."""
+
+    def __init__(self, client, max_workers=8, rate=None, journal=None):
+        self.client = client
+        self.journal = journal
+        self.max_workers = max_workers
+        self.limiter = host_limiter(client.host, rate) if rate else None
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inspection')
+
+    def _run(self, query, params):
+        if self.journal:
+            done = self.journal.get(query, params)
+            if done is not None:
+                return done
+        if self.limiter:
+            self.limiter.acquire()
+        resp = self.client.query(query, params)
+        if self.journal:
+            self.journal.record(query, params, resp)
+        return resp
+
+    def submit(self, query, params=None):
+        return self.pool.submit(self._run, query, params)
+
+    def map(self, queries, window=None):
+        """Run (query | (query, params)) items; yields responses in submission order.
+        At most WINDOW queries (default 4 x max_workers) are in flight or buffered, so
+        results are streamed rather than accumulated."""
+        window = window or 4 * self.max_workers
+        pending = deque()
+        for q in queries:
+            query, params = (q, None) if isinstance(q, str) else q
+            pending.append(self.submit(query, params))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_queries(client, queries, max_workers=8, rate=None, journal=None):
+    """Run all queries concurrently; returns a list of responses in input order."""
+    with QueryExecutor(client, max_workers=max_workers, rate=rate, journal=journal) as ex:
+        return list(ex.map(queries))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Descendants and per-local reports as one in-process pipeline.
+Replaces the discover_descendants.py -> assemble_descendant_paths.py ->
+descendants_products_report.py / assemble_full_local_101010.py chain: the stages
+hand nodes, paths and product rows to each other in memory instead of through
+pretty-printed JSON files, and root/locals are arguments.
+Stages:
+    discover   descendants of ROOT (recursive CTE, chunked BFS fallback)
+    paths      LOCAL_PATH/LOCAL_DEPTH from the TGFLOC cache, missing ancestors in one batch
+    products   per-local aggregates of every descendant, keyset-paged over many locals
+               per query (as generate_local_tree.py) -> descendants_{ROOT}_products.*
+    local      per --locals entry: TGFLOC/TGFPAR row, products and last purchases
+               -> report_{LOCAL}_everything.*
+The local stages run on a side thread while the product pages stream; both
+share the client and the job journal (--resume, see job_journal.py), and --rate
+limits the last-purchase fan-out of the local reports.
+Usage: python3 scripts/report_pipeline.py [--root 101000] [--locals 101010,...] [--no-products]
+                                          [--rate 20] [--resume] [--dump]
+--dump also writes the intermediate files of the old chain (descendants_{ROOT}.json,
+descendants_{ROOT}_paths.json, report_{LOCAL}_loc/products_response.json), for
+debugging or for running one of the single-step scripts on them.
+Reports are written as .json/.jsonl/.csv/.txt, plus .parquet when the optional
+pyarrow dependency is installed (see report_writers.py).
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import stock_queries
+from inspection_client import client_from_base
+from job_journal import JobJournal
+from loc_cache import LocationCache
+from loc_paths import PATH_KEYS, build_paths
+from report_writers import ReportWriter, write_report
+from row_model import ROW_FIELDS, RowModel
+from stock_queries import LOCAL_PRODUCTS_QUERY, fetch_last_purchases, local_info_query
+from tracing import stage
+
+BASE = Path('docs/sqls/estoque-locais')
+LOCAL_WORKERS = 4  # last-purchase chunks of one local in flight
+
+
+def discover(client, root):
+    """Descendants of ROOT (ROOT itself excluded), keyed by CODLOCAL."""
+    return {k: v for k, v in stock_queries.discover_descendants(client, root).items() if k != root}
+
+
+def locate(client, base, nodes):
+    """Path rows (PATH_KEYS) for NODES ({cod: TGFLOC row}), in NODES order.
+    Served from the TGFLOC cache (reloaded once if it misses a node); the rest is
+    built from their ancestors, prefetched in one batch."""
+    cache = LocationCache(base / 'tgfloc_cache.sqlite', client)
+    cache.refresh()
+    cached = {cod: cache.path(cod) for cod in nodes}
+    if not all(cached.values()) and cache.refresh(force=True):
+        cached = {cod: cache.path(cod) for cod in nodes}
+    cache.close()
+    unknown = {cod: row for cod, row in nodes.items() if not cached[cod]}
+    built = build_paths(unknown, lambda ids: stock_queries.fetch_ancestors(client, ids))
+    return {cod: {k: (cached[cod] or built[cod])[k] for k in PATH_KEYS} for cod in nodes}
+
+
+def local_products(client, cods, journal=None):
+    """(CODLOCAL, product rows) for every local of CODS (ascending), from keyset-paged
+    batches covering many locals per query; a local without stock gets no rows."""
+    groups = stock_queries.iter_products_by_local(stock_queries.iter_product_batches(client, cods, journal=journal))
+    group_cod, group = next(groups, (None, []))
+    for cod in cods:
+        # both streams are ordered by CODLOCAL
+        while group_cod is not None and group_cod < cod:
+            group_cod, group = next(groups, (None, []))
+        yield cod, group if group_cod == cod else []
+
+
+def write_products(path, paths, products):
+    """Stream (CODLOCAL, rows) into the per-local products report; a local without
+    products still gets one zero row."""
+    model = RowModel()
+    with ReportWriter(path, ROW_FIELDS) as out:
+        for cod, data in products:
+            loc = model.location(paths[cod])
+            if not data:
+                out.write(model.empty_row(loc))
+            else:
+                for r in data:
+                    out.write(model.stock_row(loc, r))
+    return out
+
+
+def local_report_row(loc_row, path_info, p, last):
+    """One report_{LOCAL}_everything row: local attributes, path, product and its last purchase."""
+    last = last or {}
+    return {
+        'CODLOCAL': loc_row.get('CODLOCAL'),
+        'DESCRLOCAL': loc_row.get('DESCRLOCAL'),
+        'CODLOCALPAI': loc_row.get('CODLOCALPAI'),
+        'AD_DESCRBASE': loc_row.get('AD_DESCRBASE'),
+        'UTILIZAWMS': loc_row.get('UTILIZAWMS'),
+        'CAPACIDADEPRODUCAO': loc_row.get('CAPACIDADEPRODUCAO'),
+        'PARTNER_CODPARC': loc_row.get('CODPARC'),
+        'PARTNER_NOMEPARC': (loc_row.get('NOMEPARC') or '').strip(),
+        'LOCAL_PATH': path_info.get('LOCAL_PATH'),
+        'LOCAL_PATH_CODES': path_info.get('LOCAL_PATH_CODES'),
+        'LOCAL_DEPTH': path_info.get('LOCAL_DEPTH'),
+        'CODPROD': p.get('CODPROD'),
+        'DESCRPROD': p.get('DESCRPROD'),
+        'UNIDADE': p.get('UNIDADE'),
+        'MARCA': p.get('MARCA'),
+        'NCM': p.get('NCM'),
+        'TOTAL_ESTOQUE': p.get('TOTAL_ESTOQUE'),
+        'LAST_PURCHASE_UNIT': last.get('VLRUNIT'),
+        'LAST_PURCHASE_DATE': last.get('DTNEG'),
+        'LAST_PURCHASE_NUNOTA': last.get('NUNOTA'),
+        'LAST_PURCHASE_CODEMP': last.get('CODEMP'),
+    }
+
+
+def local_report(client, base, cod, path_info, rate=None, journal=None, dump=False):
+    """Write report_{COD}_everything.*: the local's products with their last purchase."""
+    with stage('local', local=cod) as s:
+        loc_row = (client.query(*local_info_query(cod)).get('data') or [{}])[0]
+        prod_rows = client.query(LOCAL_PRODUCTS_QUERY, [cod]).get('data') or []
+        last_by_prod = fetch_last_purchases(client, (p.get('CODPROD') for p in prod_rows),
+                                            max_workers=LOCAL_WORKERS, rate=rate, journal=journal)
+        if dump:
+            for name, rows in (('loc', [loc_row]), ('products', prod_rows)):
+                (base / f'report_{cod}_{name}_response.json').write_text(
+                    json.dumps({'data': rows}, ensure_ascii=False, indent=2, default=str))
+        w = write_report(base / f'report_{cod}_everything',
+                         (local_report_row(loc_row, path_info, p, last_by_prod.get(p.get('CODPROD')))
+                          for p in prod_rows))
+        s['rows'] = w.count
+    return w
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Descendants products and per-local reports in one run.')
+    parser.add_argument('--root', type=int, default=101000, help='root CODLOCAL whose descendants are reported')
+    parser.add_argument('--locals', default='101010', help="CODLOCALs for the full local report, comma separated ('' for none)")
+    parser.add_argument('--no-products', action='store_true', help='skip the per-local products report of the descendants')
+    parser.add_argument('--rate', type=float, default=20, help='requests/second against the inspection host (0: unthrottled)')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted run from its journal')
+    parser.add_argument('--dump', action='store_true', help='also write the intermediate JSON files')
+    args = parser.parse_args()
+
+    root = args.root
+    local_cods = list(dict.fromkeys(int(c) for c in args.locals.split(',') if c.strip()))
+    BASE.mkdir(parents=True, exist_ok=True)
+    client = client_from_base(BASE, pool_size=1 + LOCAL_WORKERS)
+    journal = JobJournal(BASE / 'journals' / 'report_pipeline.jsonl', resume=args.resume)
+
+    with stage('discover', root=root) as s:
+        nodes = discover(client, root)
+        s['locals'] = len(nodes)
+    print('Discovered', len(nodes), 'descendants of', root)
+
+    with stage('paths', nodes=len(nodes)) as s:
+        # report locals outside the subtree are located along with it
+        outside = [cod for cod in local_cods if cod not in nodes]
+        located = {cod: nodes[cod] for cod in sorted(nodes)}
+        if outside:
+            located.update((r['CODLOCAL'], r) for r in stock_queries.fetch_locations(client, outside))
+        paths = locate(client, BASE, located)
+        s['outside'] = len(outside)
+
+    if args.dump:
+        (BASE / f'descendants_{root}.json').write_text(json.dumps(
+            {'start_local': root, 'count': len(nodes), 'nodes': [nodes[k] for k in sorted(nodes)]},
+            ensure_ascii=False, indent=2))
+        write_report(BASE / f'descendants_{root}_paths', (paths[cod] for cod in sorted(nodes)), PATH_KEYS,
+                     formats=('json',))
+
+    # the local reports (one small query chain each) overlap with the product pages
+    side = ThreadPoolExecutor(max_workers=1, thread_name_prefix='local')
+    pending = [side.submit(local_report, client, BASE, cod, paths.get(cod, {}), args.rate, journal, args.dump)
+               for cod in local_cods]
+
+    if not args.no_products:
+        with stage('products+write') as s:
+            out = write_products(BASE / f'descendants_{root}_products', paths,
+                                 local_products(client, sorted(nodes), journal))
+            s['rows'] = out.count
+        print('Wrote', *out.paths, 'rows:', out.count)
+
+    for f in pending:
+        w = f.result()
+        print('Wrote', *w.paths, 'rows:', w.count)
+    side.shutdown()
+    if journal.hits:
+        print('Reused', journal.hits, 'queries from the journal')
+    journal.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Streaming output stage shared by the report scripts.
+Rows are written as they arrive: CSV and JSON Lines row by row, the .json file
+as a streamed array (one object per line). The space-padded .txt table needs
+column widths up front, so cells are spooled to a temporary file while widths
+are tracked, and the table is rendered in a second pass when the report is
+closed. Memory stays bounded by one row regardless of report size.
+Everything is written to STEM.<fmt>.tmp and renamed over STEM.<fmt> only when
+the report closes successfully; a run that fails midway (an exception inside
+the with block, or close() never reached) leaves the previous outputs intact.
+.parquet is in the default formats but needs the optional pyarrow dependency
+(pip install pyarrow); without it the first writer prints a notice and the
+other formats are written as usual. The columnar file has numeric columns typed
+from the first batch, dictionary-encoded path/description columns, flushed in
+record batches of PARQUET_BATCH_ROWS.
+Usage:
+    with ReportWriter(BASE / 'tree_101000_products', FIELDS) as w:
+        for row in rows:
+            w.write(row)
+    print('Wrote', *w.paths, 'rows:', w.count)
+"""
+import csv
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import tracing
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: .parquet output is skipped without pyarrow
+    pa = pq = None
+
+DEFAULT_FORMATS = ('json', 'jsonl', 'csv', 'txt', 'parquet')
+PARQUET_BATCH_ROWS = 64 * 1024
+
+# hints for the columnar output; column types are inferred from the first batch,
+# these only keep quantities float when a batch happens to hold whole numbers and
+# pick the dictionary-encoded string columns
+FLOAT_COLUMNS = {'TOTAL_ESTOQUE', 'VLRUNIT', 'LAST_PURCHASE_UNIT', 'OWN_ESTOQUE', 'SUBTREE_ESTOQUE',
+                 'CAPACIDADEPRODUCAO'}
+DICT_COLUMNS = {'DESCRLOCAL', 'LOCAL_PATH', 'LOCAL_PATH_CODES', 'DESCRPROD', 'UNIDADE', 'MARCA', 'NCM',
+                'AD_DESCRBASE', 'UTILIZAWMS', 'PARTNER_NOMEPARC', 'PARTNER_RAZAOSOCIAL'}
+
+
+def _as_str(v):
+    return None if v is None else str(v)
+
+
+def _int(v):
+    if isinstance(v, float) and not v.is_integer():
+        raise ValueError(v)
+    return int(v)
+
+
+def _bool(v):
+    if not isinstance(v, bool):
+        raise ValueError(v)
+    return v
+
+
+def _value(cast, v):
+    """CAST(V), or None for blanks and values that do not fit."""
+    if v is None or v == '':
+        return None
+    try:
+        return cast(v)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+_notice_shown = False
+
+
+def _parquet_notice():
+    global _notice_shown
+    if not _notice_shown:
+        _notice_shown = True
+        print('pyarrow not installed, skipping .parquet outputs (optional: pip install pyarrow)')
+
+
+class ParquetSink:
+    """Columns buffered per batch and appended to a Parquet file as RecordBatches.
+    The schema is inferred from the first batch: numeric and boolean columns keep
+    their type, anything else (text, mixed values, all-null) is a string. A later
+    value that does not fit a numeric column is written as null, with a notice."""
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.schema = None
+        self.writer = None
+        self.columns = [[] for _ in fieldnames]
+        self._dropped = set()
+
+    def write(self, row):
+        for col, f in zip(self.columns, self.fieldnames):
+            col.append(row.get(f))
+        if len(self.columns[0]) >= PARQUET_BATCH_ROWS:
+            self.flush()
+
+    def _open(self):
+        self.schema = pa.schema([pa.field(f, _column_type(f, col)) for f, col in zip(self.fieldnames, self.columns)])
+        self.writer = pq.ParquetWriter(str(self.path), self.schema, compression='zstd',
+                                       use_dictionary=[f.name for f in self.schema
+                                                       if pa.types.is_dictionary(f.type)])
+
+    def _array(self, values, field):
+        t = field.type
+        if pa.types.is_dictionary(t):
+            return pa.array([_as_str(v) for v in values], pa.string()).dictionary_encode()
+        if pa.types.is_string(t):
+            return pa.array([_as_str(v) for v in values], pa.string())
+        try:
+            arr = pa.array(values)
+            return arr if arr.type == t else arr.cast(t)  # a safe cast: no silent truncation
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+            cast = _int if pa.types.is_integer(t) else float if pa.types.is_floating(t) else _bool
+            out = [_value(cast, v) for v in values]
+            if field.name not in self._dropped and any(o is None and v not in (None, '') for o, v in zip(out, values)):
+                self._dropped.add(field.name)
+                print(f"{self.path.name.removesuffix('.tmp')}: non-{t} values in {field.name} written as null")
+            return pa.array(out, t)
+
+    def flush(self):
+        if self.writer is None:
+            self._open()
+        arrays = [self._array(col, field) for col, field in zip(self.columns, self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.fieldnames]
+
+    def close(self):
+        if self.columns[0] or self.writer is None:
+            self.flush()
+        self.writer.close()
+
+
+def _column_type(name, values):
+    """Arrow type of column NAME, inferred from its first batch of VALUES."""
+    try:
+        t = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.string()  # mixed numbers and text
+    if pa.types.is_integer(t):
+        return pa.float64() if name in FLOAT_COLUMNS else pa.int64()
+    if pa.types.is_floating(t):
+        return pa.float64()
+    if pa.types.is_boolean(t):
+        return t
+    return pa.dictionary(pa.int32(), pa.string()) if name in DICT_COLUMNS else pa.string()
+
+
+class ReportWriter:
+    def __init__(self, stem, fieldnames=None, formats=DEFAULT_FORMATS):
+        """STEM is the output path without extension; FIELDNAMES default to the first row's keys."""
+        self.stem = Path(stem)
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        if 'parquet' in formats and pa is None:
+            _parquet_notice()
+            formats = [fmt for fmt in formats if fmt != 'parquet']
+        self.formats = tuple(formats)
+        self.paths = [self.stem.with_name(f'{self.stem.name}.{fmt}') for fmt in self.formats]
+        self._tmp_paths = [path.with_name(path.name + '.tmp') for path in self.paths]
+        self.count = 0
+        self._files = {fmt: path.open('w', newline='' if fmt == 'csv' else None, encoding='utf-8')
+                       for fmt, path in zip(self.formats, self._tmp_paths) if fmt != 'parquet'}
+        self._json = 'json' in self._files or 'jsonl' in self._files
+        self._parquet = None
+        self._csv = None
+        self._spool = None
+        self._widths = None
+        if 'json' in self._files:
+            self._files['json'].write('[')
+
+    def _start(self, row):
+        if self.fieldnames is None:
+            self.fieldnames = list(row.keys())
+        if 'csv' in self._files:
+            self._csv = csv.DictWriter(self._files['csv'], fieldnames=self.fieldnames, extrasaction='ignore')
+            self._csv.writeheader()
+        if 'txt' in self._files:
+            self._spool = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+            self._spool_writer = csv.writer(self._spool)
+            self._widths = [len(h) for h in self.fieldnames]
+        if 'parquet' in self.formats:
+            self._parquet = ParquetSink(self._tmp_paths[self.formats.index('parquet')], self.fieldnames)
+
+    def write(self, row):
+        if self.count == 0:
+            self._start(row)
+        if self._json:
+            text = json.dumps(row, ensure_ascii=False)  # serialized once for .json and .jsonl
+            if 'json' in self._files:
+                self._files['json'].write(('\n' if self.count == 0 else ',\n') + text)
+            if 'jsonl' in self._files:
+                self._files['jsonl'].write(text + '\n')
+        if self._csv:
+            self._csv.writerow(row)
+        if self._parquet:
+            self._parquet.write(row)
+        if self._spool:
+            cells = ['' if row.get(h) is None else str(row[h]) for h in self.fieldnames]
+            self._widths = [max(w, len(c)) for w, c in zip(self._widths, cells)]
+            self._spool_writer.writerow(cells)
+        self.count += 1
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+        return self
+
+    def _render_txt(self, f):
+        widths = self._widths
+        f.write(' | '.join(h.ljust(w) for h, w in zip(self.fieldnames, widths)) + '\n')
+        f.write('-+-'.join('-' * w for w in widths) + '\n')
+        self._spool.seek(0)
+        for cells in csv.reader(self._spool):
+            f.write(' | '.join(c.ljust(w) for c, w in zip(cells, widths)) + '\n')
+        self._spool.close()
+
+    def close(self):
+        if 'json' in self._files:
+            self._files['json'].write('\n]\n' if self.count else ']\n')
+        if self._spool:
+            self._render_txt(self._files['txt'])
+        if 'parquet' in self.formats:
+            if self._parquet is None and self.fieldnames:
+                self._parquet = ParquetSink(self._tmp_paths[self.formats.index('parquet')], self.fieldnames)
+            if self._parquet:
+                self._parquet.close()
+        for f in self._files.values():
+            f.close()
+        for tmp, path in zip(self._tmp_paths, self.paths):
+            if tmp.exists():
+                os.replace(tmp, path)
+        tracing.event('report', stem=str(self.stem), rows=self.count, formats=list(self.formats))
+
+    def abort(self):
+        """Drop the partial output; the previous STEM.<fmt> files are left as they were."""
+        if self._spool:
+            self._spool.close()
+        if self._parquet and self._parquet.writer:
+            self._parquet.writer.close()
+        for f in self._files.values():
+            f.close()
+        for tmp in self._tmp_paths:
+            tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def write_report(stem, rows, fieldnames=None, formats=DEFAULT_FORMATS):
+    """Stream ROWS (any iterable) to STEM.{formats}; returns the closed writer."""
+    with ReportWriter(stem, fieldnames, formats) as w:
+        w.write_all(rows)
+    return w
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Error types and failure policy for the /inspection/query call path.
+- RetryPolicy: exponential backoff with full jitter, honoring Retry-After.
+- AdaptiveLimiter: AIMD cap on in-flight requests; halves on 5xx/429, grows back
+  by one slot per window of successes.
+- CircuitBreaker: after consecutive server failures, holds callers for a
+  cool-down and lets a single probe through; gives up with CircuitOpenError
+  once the endpoint has been down longer than max_outage.
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class InspectionError(Exception):
+    def __init__(self, message, status=None, query=None):
+        super().__init__(message)
+        self.status = status
+        self.query = query
+
+
+class TransportError(InspectionError):
+    """Network failure, timeout or an unparseable response."""
+
+
+class ServerError(InspectionError):
+    """5xx from the endpoint (or a body carrying statusCode >= 500)."""
+
+
+class ThrottledError(InspectionError):
+    """429 Too Many Requests."""
+
+    def __init__(self, message, status=None, query=None, retry_after=None):
+        super().__init__(message, status, query)
+        self.retry_after = retry_after
+
+
+class QueryRejected(InspectionError):
+    """4xx: the statement itself was refused; retrying will not help."""
+
+
+class AuthError(QueryRejected):
+    """401/403: token missing, expired or not allowed."""
+
+
+class CircuitOpenError(InspectionError):
+    """The endpoint kept failing for longer than the breaker tolerates."""
+
+
+RETRYABLE = (TransportError, ServerError, ThrottledError)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    def __init__(self, retries=4, base=0.5, cap=30.0):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt, error=None):
+        """Sleep before retry number ATTEMPT (1-based)."""
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return min(self.cap, retry_after)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, overloaded=False):
+        with self.cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=5.0, max_outage=300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_outage = max_outage
+        self.failures = 0
+        self.opened_at = None
+        self.retry_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Block while open; raise CircuitOpenError when the outage is too long."""
+        while True:
+            with self.lock:
+                if self.opened_at is None:
+                    return
+                now = time.monotonic()
+                if now - self.opened_at > self.max_outage:
+                    raise CircuitOpenError(f'inspection endpoint failing for {now - self.opened_at:.0f}s')
+                if now >= self.retry_at and not self.probing:
+                    self.probing = True  # half-open: let exactly one call through
+                    return
+                wait = max(0.05, self.retry_at - now)
+            time.sleep(wait)
+
+    def record(self, ok):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                now = time.monotonic()
+                if self.opened_at is None:
+                    self.opened_at = now
+                backoff = self.cooldown * 2 ** min(6, self.failures - self.threshold)
+                self.retry_at = now + backoff
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Row model for the per-local product reports.
+A report row is a location's path attributes plus one product aggregate of it
+(or a zero-stock row for a location without products). Rows are streamed to the
+writers as they are built (see report_writers.py), so they are plain dicts and
+nothing is held per row.
+Usage:
+    model = RowModel(paths)                  # {CODLOCAL: path row}
+    for cod, loc in model.locations():
+        writer.write(model.stock_row(loc, response_row))
+"""
+LOCATION_KEYS = ('CODLOCAL', 'DESCRLOCAL', 'LOCAL_PATH', 'LOCAL_PATH_CODES', 'LOCAL_DEPTH')
+PRODUCT_KEYS = ('DESCRPROD', 'UNIDADE', 'MARCA', 'NCM')
+ROW_FIELDS = [*LOCATION_KEYS, 'CODPROD', *PRODUCT_KEYS, 'TOTAL_ESTOQUE']
+
+
+class RowModel:
+    def __init__(self, paths=()):
+        self.locs = {}  # CODLOCAL -> (CODLOCAL, DESCRLOCAL, LOCAL_PATH, LOCAL_PATH_CODES, LOCAL_DEPTH)
+        for cod in sorted(paths):
+            self.location(paths[cod])
+
+    def locations(self):
+        """(CODLOCAL, location) in CODLOCAL order."""
+        return sorted(self.locs.items())
+
+    def location(self, info):
+        """The location of path row INFO, added on first sight."""
+        cod = info['CODLOCAL']
+        loc = self.locs.get(cod)
+        if loc is None:
+            loc = self.locs[cod] = (cod, info.get('DESCRLOCAL'), info.get('LOCAL_PATH'),
+                                    info.get('LOCAL_PATH_CODES'), info.get('LOCAL_DEPTH') or 0)
+        return loc
+
+    def stock_row(self, loc, r):
+        """Report row for response row R at location LOC."""
+        return self._row(loc, r, r.get('TOTAL_ESTOQUE'))
+
+    def empty_row(self, loc):
+        """The zero-stock row reported for a location without products."""
+        return self._row(loc, {}, 0)
+
+    @staticmethod
+    def _row(loc, r, total):
+        return {
+            'CODLOCAL': loc[0],
+            'DESCRLOCAL': loc[1],
+            'LOCAL_PATH': loc[2],
+            'LOCAL_PATH_CODES': loc[3],
+            'LOCAL_DEPTH': loc[4],
+            'CODPROD': r.get('CODPROD'),
+            'DESCRPROD': r.get('DESCRPROD'),
+            'UNIDADE': r.get('UNIDADE'),
+            'MARCA': r.get('MARCA'),
+            'NCM': r.get('NCM'),
+            'TOTAL_ESTOQUE': total,
+        }
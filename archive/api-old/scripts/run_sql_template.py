@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Run a single-product SQL template for many CODPRODs.
+Usage: python3 scripts/run_sql_template.py TEMPLATE.sql (--codprods 3680,9558 | --codprods-file FILE)
+           [--statement N ...] [--set NAME=VALUE ...] [--replace OLD=NEW ...] [--literal 3680]
+           [--chunk-size 128] [--max-workers 8] [--rate 20] [--name NAME] [--dry-run]
+Each runnable statement of the template is rewritten to a chunked set-based
+query where possible (see sql_templates.py), otherwise run once per product;
+the queries go through QueryExecutor concurrently and the rows of all chunks are
+streamed, in product order, into one report per statement:
+docs/sqls/estoque-locais/templates/{NAME}_s{N}.json/.jsonl/.csv/.txt(/.parquet)
+--set overrides DECLARE @NAME values; --replace swaps a quoted literal ('OLD' -> 'NEW'),
+e.g. the cut-off date hard-coded in ultima-compra-produto.sql.
+"""
+import argparse
+from pathlib import Path
+
+from inspection_client import client_from_base
+from query_executor import QueryExecutor
+from report_writers import write_report
+from resilience import InspectionError
+from sql_templates import RN_COLUMN, SqlTemplate
+from tracing import stage
+
+
+def pairs(values):
+    out = {}
+    for v in values or ():
+        k, _, val = v.partition('=')
+        out[k.strip()] = val
+    return out
+
+
+def value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+parser = argparse.ArgumentParser(description='Run a single-product SQL template for many products.')
+parser.add_argument('template', type=Path)
+parser.add_argument('--codprods', help='comma separated CODPRODs')
+parser.add_argument('--codprods-file', type=Path, help='file with CODPRODs, one per line (# comments allowed)')
+parser.add_argument('--statement', type=int, action='append', help='1-based statement number (default: all runnable)')
+parser.add_argument('--set', action='append', metavar='NAME=VALUE', help='override a DECLARE @NAME value')
+parser.add_argument('--replace', action='append', metavar='OLD=NEW', help="replace the literal 'OLD' with 'NEW'")
+parser.add_argument('--literal', type=int, help='product code hard-coded in the template (default: detected)')
+parser.add_argument('--chunk-size', type=int, default=128)
+parser.add_argument('--max-workers', type=int, default=8)
+parser.add_argument('--rate', type=float, help='requests/second against the inspection host')
+parser.add_argument('--name', help='output name (default: template file name)')
+parser.add_argument('--dry-run', action='store_true', help='print the plan and the first query of each statement')
+ARGS = parser.parse_args()
+
+CODPRODS = [int(c) for c in (ARGS.codprods or '').split(',') if c.strip()]
+if ARGS.codprods_file:
+    for line in ARGS.codprods_file.read_text().splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            CODPRODS.append(int(line))
+CODPRODS = list(dict.fromkeys(CODPRODS))
+if not CODPRODS:
+    parser.error('no CODPRODs given (--codprods / --codprods-file)')
+
+overrides = {k: value(v) for k, v in pairs(ARGS.set).items()}
+TEMPLATE = SqlTemplate.load(ARGS.template, overrides=overrides, literal=ARGS.literal, replace=pairs(ARGS.replace))
+NAME = ARGS.name or TEMPLATE.name
+BASE = Path('docs/sqls/estoque-locais')
+OUT = BASE / 'templates'
+
+selected = [s for s in TEMPLATE.statements if not ARGS.statement or s.index in ARGS.statement]
+for s in selected:
+    print(f's{s.index}:', s.mode or 'skipped', '' if s.runnable else f'({s.error})')
+
+if ARGS.dry_run:
+    for s in selected:
+        if s.runnable:
+            sql, params, _ = next(s.queries(CODPRODS, ARGS.chunk_size))
+            print(f'\n-- s{s.index} ({s.mode})\n{sql}\n-- params: {params}')
+    raise SystemExit(0)
+
+OUT.mkdir(parents=True, exist_ok=True)
+CLIENT = client_from_base(BASE, pool_size=ARGS.max_workers)
+executor = QueryExecutor(CLIENT, max_workers=ARGS.max_workers, rate=ARGS.rate)
+
+
+def iter_rows(stmt):
+    """Rows of every chunk, in CODPROD order; per-product runs get a CODPROD column."""
+    plan = list(stmt.queries(CODPRODS, ARGS.chunk_size))
+    for (_, _, covered), resp in zip(plan, executor.map([(sql, params) for sql, params, _ in plan])):
+        for r in resp.get('data') or []:
+            r.pop(RN_COLUMN, None)
+            if stmt.mode == 'each' and not any(k.upper() == 'CODPROD' for k in r):
+                r = {'CODPROD': covered[0], **r}
+            yield r
+
+
+failed = 0
+for stmt in selected:
+    if not stmt.runnable:
+        continue
+    try:
+        with stage(f'template_s{stmt.index}', mode=stmt.mode, products=len(CODPRODS)) as s:
+            w = write_report(OUT / f'{NAME}_s{stmt.index}', iter_rows(stmt))
+            s['rows'] = w.count
+        print('Wrote', *w.paths, 'rows:', w.count)
+    except InspectionError as e:
+        failed += 1
+        print(f's{stmt.index} failed:', str(e)[:300])
+executor.close()
+raise SystemExit(1 if failed else 0)
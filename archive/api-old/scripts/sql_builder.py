@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""Parameterized statements for /inspection/query ('?' placeholders + params).
+IN lists are padded up to a fixed bucket size (repeating the last value, which
+IN ignores), so the server sees a handful of distinct statement texts and can
+reuse their plans; lists larger than the biggest bucket are split into chunks,
+keeping every statement under SQL Server's 2100-parameter limit.
+Usage:
+    for sql, params in in_queries("SELECT ... WHERE CODLOCAL {in} ORDER BY CODLOCAL;", cods):
+        client.query(sql, params)
+"""
+
+IN_BUCKETS = (8, 32, 128, 512)
+MAX_IN = IN_BUCKETS[-1]
+
+
+def bucket_size(n):
+    for b in IN_BUCKETS:
+        if n <= b:
+            return b
+    return MAX_IN
+
+
+def in_clause(values):
+    """('IN (?,...)', padded params) for at most MAX_IN values."""
+    values = list(values)
+    if not values:
+        raise ValueError('empty IN list')
+    if len(values) > MAX_IN:
+        raise ValueError(f'IN list of {len(values)} values exceeds {MAX_IN}; use in_queries()')
+    size = bucket_size(len(values))
+    padded = values + [values[-1]] * (size - len(values))
+    return 'IN (' + ','.join('?' * size) + ')', padded
+
+
+def in_queries(template, values, before=(), after=(), chunk_size=MAX_IN):
+    """Yield (sql, params) for TEMPLATE with its `{in}` marker bound to each chunk of VALUES.
+    BEFORE/AFTER are params for placeholders preceding/following the IN list."""
+    values = list(dict.fromkeys(values))
+    chunk_size = min(chunk_size, MAX_IN)
+    for i in range(0, len(values), chunk_size):
+        clause, params = in_clause(values[i:i + chunk_size])
+        yield template.replace('{in}', clause), [*before, *params, *after]
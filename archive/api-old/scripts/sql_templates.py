@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Single-product SQL templates (sql/*.sql) turned into multi-product statements.
+A template file is split into statements; DECLARE @var ... = value lines become
+bindable parameters. In each runnable statement the single-product predicate
+(X.CODPROD = @codprod, or = <literal>) is located and the statement is planned:
+- 'set':  plain SELECTs are rewritten to X.CODPROD IN (chunk) - CODPROD is added
+          to the select list, GROUP BY and ORDER BY, and SELECT TOP n ... ORDER BY
+          becomes ROW_NUMBER() OVER (PARTITION BY X.CODPROD ...) <= n (not when that
+          ORDER BY names a select alias, which the window cannot see, or a position);
+- 'each': anything that cannot be rewritten safely (CTEs, DISTINCT TOP, several
+          references to the product) runs once per product, with the product bound
+          as a parameter.
+Statements that assign variables (SELECT @v = ...) cannot run through the
+endpoint and are reported as unsupported. check_sql_templates.py pins the
+rewrites of the sql/ templates; run it after changing the rules below.
+Usage:
+    tpl = SqlTemplate.load('sql/consumo_produto_template.sql', overrides={'dt_start': '2025-06-01'})
+    for stmt in tpl.statements:
+        for sql, params, codprods in stmt.queries([3680, 9558], chunk_size=128):
+            client.query(sql, params)
+"""
+import re
+from pathlib import Path
+
+from sql_builder import MAX_IN, in_clause
+
+PRODUCT_VAR = 'codprod'
+RN_COLUMN = 'RN__'
+
+_COMMENTS = re.compile(r"('(?:[^']|'')*')|--[^\n]*|/\*.*?\*/", re.S)
+_STARTS = re.compile(r'^(SELECT|WITH|DECLARE|SET|UPDATE|INSERT|DELETE)\b', re.I)
+_DECLARE = re.compile(r"^DECLARE\s+@(\w+)\s+\w+(?:\s*\([^)]*\))?\s*(?:=\s*(.+?))?\s*$", re.I | re.S)
+_ASSIGNS = re.compile(r'^SELECT\s+(?:TOP\s+\d+\s+)?@\w+\s*=', re.I)
+_HEAD = re.compile(r'^SELECT\s+(DISTINCT\s+)?(?:TOP\s+(\d+)\s+)?', re.I)
+_AGGREGATE = re.compile(r'\b(COUNT|SUM|AVG|MIN|MAX|GROUPING)\s*\(', re.I)
+_CLAUSES = re.compile(r"'(?:[^']|'')*'|\(|\)|\b(FROM|WHERE|GROUP\s+BY|HAVING|ORDER\s+BY)\b", re.I)
+_BIND = re.compile(r"('(?:[^']|'')*')|(\{in\}|\{codprod\})|@(\w+)")
+
+
+class Unsupported(Exception):
+    pass
+
+
+def strip_comments(text):
+    return _COMMENTS.sub(lambda m: m.group(1) or '', text)
+
+
+def split_statements(text):
+    """Statements of a script: split at top-level ';' and at SELECT/WITH/DECLARE/...
+    starting a line at column 0 while no parenthesis is open (the files in sql/ mix
+    both styles)."""
+    statements, current, depth = [], [], 0
+    for line in strip_comments(text).splitlines():
+        prev = '\n'.join(current).strip()
+        # a WITH's main query starts at column 0 right after its CTE definitions
+        if depth == 0 and _STARTS.match(line) and prev and not (prev[:4].upper() == 'WITH' and prev.endswith(')')):
+            statements.append('\n'.join(current))
+            current = []
+        start = 0
+        for m in re.finditer(r"'(?:[^']|'')*'|[();]", line):
+            tok = m.group(0)
+            if tok == '(':
+                depth += 1
+            elif tok == ')':
+                depth -= 1
+            elif tok == ';' and depth == 0:
+                current.append(line[start:m.end()])
+                statements.append('\n'.join(current))
+                current, start = [], m.end()
+        current.append(line[start:])
+    statements.append('\n'.join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+def _literal(value):
+    value = value.strip().rstrip(';').strip()
+    if value.startswith("'") and value.endswith("'"):
+        return value[1:-1].replace("''", "'")
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            raise Unsupported(f'cannot bind DECLARE value {value!r}')
+
+
+def _top_level(sql):
+    """{clause: index} of the first FROM/WHERE/GROUP BY/HAVING/ORDER BY outside parentheses."""
+    found, depth = {}, 0
+    for m in _CLAUSES.finditer(sql):
+        tok = m.group(0)
+        if tok == '(':
+            depth += 1
+        elif tok == ')':
+            depth -= 1
+        elif m.group(1) and depth == 0:
+            found.setdefault(re.sub(r'\s+', ' ', m.group(1).upper()), m.start())
+    return found
+
+
+def _split_list(text):
+    """Items of a comma-separated list, ignoring commas inside parentheses and strings."""
+    items, depth, start = [], 0, 0
+    for m in re.finditer(r"'(?:[^']|'')*'|[(),]", text):
+        tok = m.group(0)
+        if tok == '(':
+            depth += 1
+        elif tok == ')':
+            depth -= 1
+        elif tok == ',' and depth == 0:
+            items.append(text[start:m.start()].strip())
+            start = m.end()
+    items.append(text[start:].strip())
+    return items
+
+
+def _output_name(item):
+    m = re.search(r'\bAS\s+\[?(\w+)\]?\s*$', item, re.I) or re.match(r'^(?:\w+\.)?\[?(\w+)\]?$', item)
+    return m.group(1) if m else None
+
+
+def _alias(item):
+    """Name a select item introduces (expr AS name / name = expr), None for plain columns."""
+    m = re.search(r'\bAS\s+\[?(\w+)\]?\s*$', item, re.I) or re.match(r'^\[?(\w+)\]?\s*=(?!=)', item)
+    return m.group(1) if m else None
+
+
+def _check_order(order_list, items, window):
+    """Reject ORDER BY items the rewrite would break: positions (shifted by the added
+    CODPROD column) and, inside ROW_NUMBER() OVER (WINDOW), select aliases, which
+    the window cannot see."""
+    aliases = {a.upper() for a in map(_alias, items) if a}
+    for item in _split_list(order_list):
+        expr = re.sub(r'\s+(ASC|DESC)$', '', item.strip(), flags=re.I).strip('[] ')
+        if expr.isdigit():
+            raise Unsupported(f'ORDER BY position {expr}')
+        if window and expr.upper() in aliases:
+            raise Unsupported(f'ORDER BY select alias {expr} (not visible to ROW_NUMBER)')
+
+
+class Statement:
+    def __init__(self, index, sql, variables, literal=None):
+        self.index = index
+        self.sql = sql
+        self.variables = variables
+        self.literal = literal
+        self.error = None
+        self.mode = None
+        self.template = None
+        try:
+            self.mode, self.template = self._plan()
+        except Unsupported as e:
+            self.error = str(e)
+
+    @property
+    def runnable(self):
+        return self.error is None
+
+    def _predicate(self):
+        target = rf'@{PRODUCT_VAR}\b' + (rf'|\b{self.literal}\b' if self.literal is not None else '')
+        return re.compile(rf'\b((?:\w+\.)?CODPROD)\s*=\s*(?:{target})', re.I)
+
+    def _plan(self):
+        sql = self.sql.rstrip(';').strip()
+        if _DECLARE.match(sql):
+            raise Unsupported('declaration')
+        if _ASSIGNS.match(sql):
+            raise Unsupported('assigns variables (SELECT @v = ...), not runnable through the endpoint')
+        if not re.match(r'^(SELECT|WITH)\b', sql, re.I):
+            raise Unsupported('not a query')
+        for name in re.findall(r'@(\w+)', re.sub(r"'(?:[^']|'')*'", '', sql)):
+            if name.lower() != PRODUCT_VAR and self.variables.get(name.lower()) is None:
+                raise Unsupported(f'@{name} has no value (use --set {name.lower()}=...)')
+        pred = self._predicate()
+        matches = list(pred.finditer(sql))
+        if not matches:
+            raise Unsupported('no single-product predicate (CODPROD = @codprod / literal)')
+        refs = len(re.findall(rf'@{PRODUCT_VAR}\b', sql, re.I))
+        if self.literal is not None:
+            refs += len(re.findall(rf'\b{self.literal}\b', sql))
+        if len(matches) == 1 and refs == 1 and not sql.upper().startswith('WITH'):
+            try:
+                return 'set', self._rewrite_set(sql, matches[0])
+            except Unsupported:
+                pass
+        return 'each', self._rewrite_each(sql)
+
+    def _rewrite_each(self, sql):
+        sql = self._predicate().sub(lambda m: f'{m.group(1)} = {{codprod}}', sql)
+        sql = re.sub(rf'@{PRODUCT_VAR}\b', '{codprod}', sql, flags=re.I)
+        if self.literal is not None:
+            sql = re.sub(rf'\b{self.literal}(\s+AS\s+\w*codprod\b)', r'{codprod}\1', sql, flags=re.I)
+        return sql
+
+    def _rewrite_set(self, sql, match):
+        col = match.group(1)
+        sql = sql[:match.start()] + f'{col} {{in}}' + sql[match.end():]
+        head = _HEAD.match(sql)
+        clauses = _top_level(sql)
+        if not head or 'FROM' not in clauses:
+            raise Unsupported('unrecognized SELECT')
+        distinct, top = head.group(1), head.group(2)
+        select_list = sql[head.end():clauses['FROM']]
+        end = len(sql)
+        order_at = clauses.get('ORDER BY', end)
+        group_at = clauses.get('GROUP BY')
+        items = _split_list(select_list)
+        has_codprod = any((_output_name(i) or '').upper() == 'CODPROD' for i in items)
+        add_col = '' if has_codprod else f'{col} AS CODPROD, '
+        if top:
+            if distinct or group_at is not None or _AGGREGATE.search(select_list) or 'ORDER BY' not in clauses:
+                raise Unsupported('TOP without a plain ORDER BY')
+            order_list = sql[order_at + len('ORDER BY'):].strip()
+            _check_order(order_list, items, window=True)
+            inner = (f'SELECT {add_col}{select_list.strip()}, ROW_NUMBER() OVER (PARTITION BY {col} '
+                     f'ORDER BY {order_list}) AS {RN_COLUMN} {sql[clauses["FROM"]:order_at].strip()}')
+            return f'SELECT * FROM ({inner}) T__ WHERE T__.{RN_COLUMN} <= {int(top)} ORDER BY T__.CODPROD, T__.{RN_COLUMN};'
+        out = sql[:head.end()] + add_col + sql[head.end():clauses['FROM']]
+        if group_at is not None:
+            group_end = min((v for k, v in clauses.items() if k in ('HAVING', 'ORDER BY') and v > group_at),
+                            default=end)
+            group_list = sql[group_at + len('GROUP BY'):group_end]
+            out += sql[clauses['FROM']:group_at]
+            if col.upper() in [g.upper() for g in _split_list(group_list)]:
+                out += sql[group_at:group_end]
+            else:
+                out += f'GROUP BY {col}, ' + group_list.lstrip()
+            rest_at = group_end
+        else:
+            out += sql[clauses['FROM']:order_at]
+            if _AGGREGATE.search(select_list):
+                out = out.rstrip() + f' GROUP BY {col} '
+            rest_at = order_at
+        if 'ORDER BY' in clauses:
+            _check_order(sql[order_at + len('ORDER BY'):], items, window=False)
+            rest = sql[rest_at:order_at] + f'ORDER BY {col}, ' + sql[order_at + len('ORDER BY'):].lstrip()
+        else:
+            rest = sql[rest_at:].rstrip() + f' ORDER BY {col}'
+        return (out + rest).rstrip().rstrip(';') + ';'
+
+    def queries(self, codprods, chunk_size=MAX_IN):
+        """Yield (sql, params, codprods covered) for CODPRODS."""
+        codprods = list(dict.fromkeys(int(c) for c in codprods))
+        if self.mode == 'set':
+            size = min(chunk_size, MAX_IN)
+            for i in range(0, len(codprods), size):
+                chunk = codprods[i:i + size]
+                yield (*self.bind(chunk), chunk)
+        else:
+            for codprod in codprods:
+                yield (*self.bind([codprod]), [codprod])
+
+    def bind(self, codprods):
+        """SQL with '?' placeholders and its params: {in} gets the padded chunk,
+        {codprod} the single product and @vars their DECLARE/override value."""
+        params = []
+
+        def sub(m):
+            if m.group(1):
+                return m.group(1)
+            if m.group(2) == '{in}':
+                clause, values = in_clause(codprods)
+                params.extend(values)
+                return clause
+            if m.group(2) == '{codprod}':
+                params.append(codprods[0])
+                return '?'
+            name = m.group(3).lower()
+            if self.variables.get(name) is None:
+                raise Unsupported(f'@{m.group(3)} has no value (use --set {name}=...)')
+            params.append(self.variables[name])
+            return '?'
+        return _BIND.sub(sub, self.template), params
+
+
+class SqlTemplate:
+    def __init__(self, text, name='template', overrides=None, literal=None, replace=None):
+        self.name = name
+        for old, new in (replace or {}).items():
+            text = text.replace(f"'{old}'", f"'{new}'")
+        raw = split_statements(text)
+        self.variables = {}
+        for sql in raw:
+            m = _DECLARE.match(sql.rstrip(';').strip())
+            if m:
+                self.variables[m.group(1).lower()] = _literal(m.group(2)) if m.group(2) else None
+        for k, v in (overrides or {}).items():
+            self.variables[k.lower()] = v
+        if literal is None:
+            # the product hard-coded in the template: the DECLAREd @codprod, else the most common CODPROD = n
+            found = re.findall(r'\bCODPROD\s*=\s*(\d+)\b', strip_comments(text), re.I)
+            literal = self.variables.get(PRODUCT_VAR) or (max(set(found), key=found.count) if found else None)
+        self.literal = literal
+        self.statements = [Statement(i, sql, self.variables, literal) for i, sql in enumerate(raw, 1)]
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        path = Path(path)
+        return cls(path.read_text(encoding='utf-8'), path.stem, **kwargs)
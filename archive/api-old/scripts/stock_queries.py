@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Set-based location/stock/purchase lookups shared by the report scripts.
+Each helper takes an InspectionClient and a list of keys, splits the keys into
+bounded IN (...) chunks and answers the whole list in O(keys/chunk) round-trips.
+Statements are parameterized ('?' + params, IN lists padded to sql_builder buckets)
+and the *_query helpers return (sql, params).
+"""
+import re
+import time
+import unicodedata
+from functools import lru_cache
+
+from query_executor import run_queries
+from resilience import RETRYABLE, AuthError, QueryRejected, ServerError
+from sql_builder import MAX_IN, in_clause, in_queries
+
+CHUNK_SIZE = MAX_IN
+PAGE_SIZE = 5000
+MAX_TREE_DEPTH = 100
+LOC_COLUMNS = "CODLOCAL, CODLOCALPAI, LTRIM(RTRIM(DESCRLOCAL)) AS DESCRLOCAL"
+
+# flipped to False the first time the endpoint rejects a recursive CTE. The endpoint
+# reports SQL errors as 500s, so a 500 counts as a rejection when its message reads
+# like a SQL error or when it persists through the retry policy; 429s and transport
+# errors are retried like any other query and never disable the CTE path.
+_cte_supported = True
+SQL_ERROR = re.compile(r'syntax|incorrect|invalid|unsupported|not supported|recursi|statement|\bsql\b', re.IGNORECASE)
+
+
+def chunked(items, size=CHUNK_SIZE):
+    """Consecutive slices of ITEMS, never larger than the biggest IN bucket."""
+    items = list(items)
+    size = min(size, MAX_IN)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# per-product aggregates of one local (params: [CODLOCAL])
+LOCAL_PRODUCTS_QUERY = "SELECT P.CODPROD, LTRIM(RTRIM(P.DESCRPROD)) AS DESCRPROD, LTRIM(RTRIM(P.UNIDADE)) AS UNIDADE, LTRIM(RTRIM(P.MARCA)) AS MARCA, P.NCM, SUM(ISNULL(E.ESTOQUE,0)) AS TOTAL_ESTOQUE FROM [SANKHYA].[TGFEST] E JOIN [SANKHYA].[TGFPRO] P ON P.CODPROD = E.CODPROD WHERE E.CODLOCAL = ? GROUP BY P.CODPROD, P.DESCRPROD, P.UNIDADE, P.MARCA, P.NCM ORDER BY P.DESCRPROD;"
+
+
+def local_info_query(cod):
+    """TGFLOC attributes of one local with its partner (TGFPAR)."""
+    return (
+        "SELECT L.CODLOCAL, LTRIM(RTRIM(L.DESCRLOCAL)) AS DESCRLOCAL, L.CODLOCALPAI, L.AD_DESCRBASE, "
+        "L.UTILIZAWMS, L.CAPACIDADEPRODUCAO, L.CODPARC, PAR.NOMEPARC, PAR.RAZAOSOCIAL, PAR.CGC_CPF, "
+        "PAR.TELEFONE, PAR.EMAIL "
+        "FROM [SANKHYA].[TGFLOC] L LEFT JOIN [SANKHYA].[TGFPAR] PAR ON PAR.CODPARC = L.CODPARC "
+        "WHERE L.CODLOCAL = ?;"
+    ), [int(cod)]
+
+
+def last_purchase_query(codprods):
+    clause, params = in_clause([int(x) for x in codprods])
+    return (
+        "SELECT X.CODPROD, X.VLRUNIT, X.DTNEG, X.NUNOTA, X.CODEMP FROM ("
+        "SELECT T.CODPROD, T.VLRUNIT, C.DTNEG, C.NUNOTA, C.CODEMP, "
+        "ROW_NUMBER() OVER (PARTITION BY T.CODPROD ORDER BY C.DTNEG DESC, C.NUNOTA DESC) AS RN "
+        "FROM [SANKHYA].[TGFITE] T JOIN [SANKHYA].[TGFCAB] C ON C.NUNOTA = T.NUNOTA AND C.CODEMP = T.CODEMP "
+        f"WHERE T.CODPROD {clause} AND C.TIPMOV = 'O' AND C.STATUSNOTA = 'L'"
+        ") X WHERE X.RN = 1;"
+    ), params
+
+
+def fetch_last_purchases(client, codprods, chunk_size=CHUNK_SIZE, max_workers=4, rate=None, journal=None):
+    """Latest confirmed purchase (TIPMOV 'O', STATUSNOTA 'L') per product, keyed by CODPROD."""
+    codprods = sorted({int(c) for c in codprods if c})
+    queries = [last_purchase_query(chunk) for chunk in chunked(codprods, chunk_size)]
+    out = {}
+    for resp in run_queries(client, queries, max_workers=max_workers, rate=rate, journal=journal):
+        for r in resp.get('data', []):
+            out[r['CODPROD']] = r
+    return out
+
+
+def descendants_cte_query(root):
+    """Single query returning ROOT and all its descendants with depth and full paths.
+    UP walks from ROOT to the top ancestor to build ROOT's path prefix; DOWN expands
+    the subtree from there. Paths carry a cycle guard against bad CODLOCALPAI data."""
+    root = int(root)
+    return (
+        "WITH UP AS ("
+        "SELECT CODLOCAL, CODLOCALPAI, 0 AS LVL, "
+        "CAST(LTRIM(RTRIM(DESCRLOCAL)) AS VARCHAR(MAX)) AS LOCAL_PATH, "
+        "CAST(CODLOCAL AS VARCHAR(MAX)) AS LOCAL_PATH_CODES "
+        "FROM [SANKHYA].[TGFLOC] WHERE CODLOCAL = ? "
+        "UNION ALL "
+        "SELECT P.CODLOCAL, P.CODLOCALPAI, U.LVL + 1, "
+        "CAST(LTRIM(RTRIM(P.DESCRLOCAL)) + ' > ' + U.LOCAL_PATH AS VARCHAR(MAX)), "
+        "CAST(CAST(P.CODLOCAL AS VARCHAR(20)) + '.' + U.LOCAL_PATH_CODES AS VARCHAR(MAX)) "
+        "FROM [SANKHYA].[TGFLOC] P JOIN UP U ON P.CODLOCAL = U.CODLOCALPAI "
+        "WHERE U.CODLOCALPAI <> 0 "
+        "AND '.' + U.LOCAL_PATH_CODES + '.' NOT LIKE '%.' + CAST(P.CODLOCAL AS VARCHAR(20)) + '.%'"
+        "), ROOTP AS ("
+        "SELECT TOP 1 LVL, LOCAL_PATH, LOCAL_PATH_CODES FROM UP ORDER BY LVL DESC"
+        "), DOWN AS ("
+        "SELECT L.CODLOCAL, L.CODLOCALPAI, LTRIM(RTRIM(L.DESCRLOCAL)) AS DESCRLOCAL, R.LVL AS LOCAL_DEPTH, "
+        "R.LOCAL_PATH, R.LOCAL_PATH_CODES "
+        "FROM [SANKHYA].[TGFLOC] L CROSS JOIN ROOTP R WHERE L.CODLOCAL = ? "
+        "UNION ALL "
+        "SELECT C.CODLOCAL, C.CODLOCALPAI, LTRIM(RTRIM(C.DESCRLOCAL)), D.LOCAL_DEPTH + 1, "
+        "CAST(D.LOCAL_PATH + ' > ' + LTRIM(RTRIM(C.DESCRLOCAL)) AS VARCHAR(MAX)), "
+        "CAST(D.LOCAL_PATH_CODES + '.' + CAST(C.CODLOCAL AS VARCHAR(20)) AS VARCHAR(MAX)) "
+        "FROM [SANKHYA].[TGFLOC] C JOIN DOWN D ON C.CODLOCALPAI = D.CODLOCAL "
+        "WHERE '.' + D.LOCAL_PATH_CODES + '.' NOT LIKE '%.' + CAST(C.CODLOCAL AS VARCHAR(20)) + '.%'"
+        ") SELECT CODLOCAL, CODLOCALPAI, DESCRLOCAL, LOCAL_DEPTH, LOCAL_PATH, LOCAL_PATH_CODES "
+        f"FROM DOWN ORDER BY CODLOCAL OPTION (MAXRECURSION {MAX_TREE_DEPTH});"
+    ), [root, root]
+
+
+def _cte_query(client, query, params, fallback):
+    """Rows of a recursive-CTE statement, or None once the endpoint has rejected it
+    (then _cte_supported is cleared and the caller falls back to FALLBACK)."""
+    global _cte_supported
+    try:
+        # one attempt first, so a SQL error is not retried with backoff
+        return client.query(query, params, retries=1).get('data') or []
+    except AuthError:
+        raise
+    except QueryRejected as e:
+        error = e
+    except RETRYABLE as e:
+        if not (isinstance(e, ServerError) and SQL_ERROR.search(str(e))):
+            # transient (429, transport, plain 500): the normal retry policy, Retry-After included
+            policy = client.policy
+            time.sleep(policy.delay(1, e))
+            try:
+                return client.query(query, params, retries=max(1, policy.retries - 1)).get('data') or []
+            except AuthError:
+                raise
+            except (QueryRejected, ServerError) as e2:
+                error = e2
+        else:
+            error = e
+    print(f'recursive CTE rejected, falling back to {fallback}:', str(error)[:200])
+    _cte_supported = False
+    return None
+
+
+def discover_descendants_bfs(client, root, chunk_size=CHUNK_SIZE):
+    """Level-by-level discovery (one round-trip per level and chunk); rows carry no paths."""
+    root = int(root)
+    nodes = {}
+    for r in client.query(f"SELECT {LOC_COLUMNS} FROM [SANKHYA].[TGFLOC] WHERE CODLOCAL = ?;", [root]).get('data', []):
+        nodes[r['CODLOCAL']] = r
+    seen = {root}
+    frontier = {root}
+    while frontier:
+        new_frontier = set()
+        for chunk in chunked(sorted(frontier), chunk_size):
+            clause, params = in_clause(chunk)
+            q = f"SELECT {LOC_COLUMNS} FROM [SANKHYA].[TGFLOC] WHERE CODLOCALPAI {clause} ORDER BY CODLOCAL;"
+            for r in client.query(q, params).get('data', []):
+                nodes[r['CODLOCAL']] = r
+                if r['CODLOCAL'] not in seen:
+                    seen.add(r['CODLOCAL'])
+                    new_frontier.add(r['CODLOCAL'])
+        frontier = new_frontier
+    return nodes
+
+
+def discover_descendants(client, root, use_cte=True, chunk_size=CHUNK_SIZE):
+    """ROOT plus every descendant keyed by CODLOCAL.
+    Uses the recursive CTE when the endpoint accepts it (rows then also carry
+    LOCAL_DEPTH/LOCAL_PATH/LOCAL_PATH_CODES); otherwise falls back to chunked BFS."""
+    if use_cte and _cte_supported:
+        data = _cte_query(client, *descendants_cte_query(root), 'BFS')
+        if data:
+            return {r['CODLOCAL']: r for r in data}
+    return discover_descendants_bfs(client, root, chunk_size)
+
+
+def ancestors_cte_query(cods):
+    """Rows for CODS and every ancestor above them, in one recursive query."""
+    clause, params = in_clause([int(x) for x in cods])
+    return (
+        f"WITH UP AS (SELECT {LOC_COLUMNS}, 0 AS LVL FROM [SANKHYA].[TGFLOC] WHERE CODLOCAL {clause} "
+        "UNION ALL "
+        "SELECT P.CODLOCAL, P.CODLOCALPAI, LTRIM(RTRIM(P.DESCRLOCAL)), U.LVL + 1 "
+        "FROM [SANKHYA].[TGFLOC] P JOIN UP U ON P.CODLOCAL = U.CODLOCALPAI "
+        f"WHERE U.CODLOCALPAI <> 0 AND U.CODLOCALPAI <> U.CODLOCAL AND U.LVL < {MAX_TREE_DEPTH}"
+        ") SELECT DISTINCT CODLOCAL, CODLOCALPAI, DESCRLOCAL FROM UP "
+        f"OPTION (MAXRECURSION {MAX_TREE_DEPTH});"
+    ), params
+
+
+def fetch_locations(client, cods, chunk_size=CHUNK_SIZE):
+    out = []
+    q = f"SELECT {LOC_COLUMNS} FROM [SANKHYA].[TGFLOC] WHERE CODLOCAL {{in}};"
+    for sql, params in in_queries(q, sorted(int(x) for x in cods), chunk_size=chunk_size):
+        out.extend(client.query(sql, params).get('data', []))
+    return out
+
+
+def fetch_ancestors(client, cods, chunk_size=CHUNK_SIZE):
+    """TGFLOC rows for CODS and all their ancestors.
+    One recursive-CTE query per chunk; falls back to one chunked round per level."""
+    cods = {int(c) for c in cods if c}
+    rows = {}
+    if _cte_supported:
+        for chunk in chunked(sorted(cods), chunk_size):
+            data = _cte_query(client, *ancestors_cte_query(chunk), 'level-by-level')
+            if data is None:
+                break
+            for r in data:
+                rows[r['CODLOCAL']] = r
+        else:
+            return list(rows.values())
+    pending = cods - rows.keys()
+    while pending:
+        new = {}
+        for r in fetch_locations(client, pending, chunk_size):
+            new[r['CODLOCAL']] = r
+        rows.update(new)
+        pending = {r['CODLOCALPAI'] for r in new.values()
+                   if r.get('CODLOCALPAI') and r['CODLOCALPAI'] not in rows}
+    return list(rows.values())
+
+
+def products_page_query(codlocals, page_size=PAGE_SIZE, after=None):
+    """One keyset page of per-local product aggregates, ordered by (CODLOCAL, CODPROD).
+    AFTER is the (CODLOCAL, CODPROD) of the last row of the previous page."""
+    clause, params = in_clause([int(x) for x in codlocals])
+    keyset = ''
+    if after:
+        loc, prod = int(after[0]), int(after[1])
+        keyset = " AND (E.CODLOCAL > ? OR (E.CODLOCAL = ? AND E.CODPROD > ?))"
+        params += [loc, loc, prod]
+    return (
+        f"SELECT TOP {int(page_size)} P.CODPROD, LTRIM(RTRIM(P.DESCRPROD)) AS DESCRPROD, LTRIM(RTRIM(P.UNIDADE)) AS UNIDADE, "
+        "LTRIM(RTRIM(P.MARCA)) AS MARCA, P.NCM, E.CODLOCAL, SUM(ISNULL(E.ESTOQUE,0)) AS TOTAL_ESTOQUE "
+        "FROM [SANKHYA].[TGFEST] E JOIN [SANKHYA].[TGFPRO] P ON P.CODPROD = E.CODPROD "
+        f"WHERE E.CODLOCAL {clause}{keyset} "
+        "GROUP BY P.CODPROD, P.DESCRPROD, P.UNIDADE, P.MARCA, P.NCM, E.CODLOCAL "
+        "ORDER BY E.CODLOCAL, P.CODPROD;"
+    ), params
+
+
+def iter_product_batches(client, codlocals, page_size=PAGE_SIZE, chunk_size=CHUNK_SIZE, use_cache=True,
+                         journal=None):
+    """Per-local product aggregates as a generator of row batches (one page each).
+    Locals are chunked in ascending order and paged by keyset, so the stream is
+    ordered by (CODLOCAL, CODPROD) and no single response exceeds PAGE_SIZE rows.
+    With a JobJournal, pages already fetched by an interrupted run are reused."""
+    for chunk in chunked(sorted(codlocals), chunk_size):
+        after = None
+        while True:
+            query, params = products_page_query(chunk, page_size, after)
+            resp = journal.get(query, params) if journal else None
+            if resp is None:
+                resp = client.query(query, params, use_cache=use_cache)
+                if journal:
+                    journal.record(query, params, resp)
+            data = resp.get('data', [])
+            if data:
+                yield data
+            if len(data) < page_size:
+                break
+            after = (data[-1]['CODLOCAL'], data[-1]['CODPROD'])
+
+
+@lru_cache(maxsize=64 * 1024)
+def collation_key(text):
+    """Sort key close to the server's default collation (Latin1_General_CI_AS):
+    case-insensitive, accents only break ties between otherwise equal names."""
+    text = text or ''
+    folded = text.casefold()
+    base = ''.join(c for c in unicodedata.normalize('NFKD', folded) if not unicodedata.combining(c))
+    return base, folded, text
+
+
+def _by_descrprod(rows):
+    return sorted(rows, key=lambda r: collation_key(r.get('DESCRPROD')))
+
+
+def iter_products_by_local(batches):
+    """Regroup an ordered batch stream into (CODLOCAL, rows sorted by DESCRPROD).
+    The pages come ordered by CODPROD, so each local is re-sorted here with
+    collation_key, matching ORDER BY P.DESCRPROD on the server for case and accents."""
+    cod, group = None, []
+    for batch in batches:
+        for r in batch:
+            if r['CODLOCAL'] != cod and group:
+                yield cod, _by_descrprod(group)
+                group = []
+            cod = r['CODLOCAL']
+            group.append(r)
+    if group:
+        yield cod, _by_descrprod(group)
+
+
+def server_now(client):
+    """Current server time as 'YYYY-MM-DD HH:MM:SS' (watermarks use the server clock)."""
+    data = client.query("SELECT CONVERT(VARCHAR(19), GETDATE(), 120) AS NOW;", use_cache=False).get('data') or [{}]
+    return data[0].get('NOW')
+
+
+def changed_locals_query(codlocals, since):
+    """Locals among CODLOCALS with stock movement since SINCE: TGFEST rows whose
+    DTULTMOV (a date) is on/after SINCE's day, or items of notes altered since SINCE."""
+    clause, params = in_clause([int(x) for x in codlocals])
+    return (
+        "SELECT DISTINCT E.CODLOCAL FROM [SANKHYA].[TGFEST] E "
+        f"WHERE E.CODLOCAL {clause} AND E.DTULTMOV >= CAST(? AS DATE) "
+        "UNION "
+        "SELECT DISTINCT I.CODLOCALORIG FROM [SANKHYA].[TGFITE] I "
+        "JOIN [SANKHYA].[TGFCAB] C ON C.NUNOTA = I.NUNOTA "
+        f"WHERE I.CODLOCALORIG {clause} AND C.DTALTER >= ?;"
+    ), params + [since] + params + [since]
+
+
+def fetch_changed_locals(client, codlocals, since, chunk_size=CHUNK_SIZE):
+    """Set of CODLOCALS touched by stock movements since SINCE (never served from the query cache)."""
+    out = set()
+    for chunk in chunked(sorted({int(c) for c in codlocals}), chunk_size):
+        for r in client.query(*changed_locals_query(chunk, since), use_cache=False).get('data', []):
+            out.add(r['CODLOCAL'])
+    return out
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Hierarchical stock roll-up computed locally from per-local aggregates.
+Locations are indexed once (parent taken from LOCAL_PATH_CODES), product codes
+are indexed once too, and own stock is accumulated into flat arrays while
+product rows stream by: a per-location total plus one (location, product,
+quantity) entry per row. compute() folds the location totals bottom-up (deepest
+locals first) and buckets the entries by location; per-product subtree totals
+are summed from a location's own entries and its children's subtrees when its
+rows are emitted, so only the dicts along one root-to-leaf chain are alive at a
+time, never one per location. No extra queries are made.
+Usage:
+    rollup = StockRollup(paths)          # {CODLOCAL: path row} from build_paths
+    for row in product_rows:
+        rollup.add(row['CODLOCAL'], row['CODPROD'], row['TOTAL_ESTOQUE'])
+    rollup.compute()
+"""
+from array import array
+
+LOCATION_FIELDS = ['CODLOCAL', 'DESCRLOCAL', 'LOCAL_PATH', 'LOCAL_PATH_CODES', 'LOCAL_DEPTH',
+                   'CODPROD', 'OWN_ESTOQUE', 'SUBTREE_ESTOQUE', 'SUBTREE_LOCALS']
+DEPTH_FIELDS = ['LOCAL_DEPTH', 'CODPROD', 'LOCALS', 'TOTAL_ESTOQUE']
+
+
+class StockRollup:
+    def __init__(self, paths):
+        self.cods = sorted(paths)
+        self.info = [paths[c] for c in self.cods]
+        self.index = {c: i for i, c in enumerate(self.cods)}
+        n = len(self.cods)
+        self.parent = array('l', [-1] * n)
+        self.children = [[] for _ in range(n)]
+        for i, info in enumerate(self.info):
+            codes = info['LOCAL_PATH_CODES'].split('.')
+            if len(codes) > 1:
+                self.parent[i] = self.index.get(int(codes[-2]), -1)
+                if self.parent[i] >= 0:
+                    self.children[self.parent[i]].append(i)
+        self.own = array('d', [0.0] * n)
+        self.prod_index = {}  # CODPROD -> product index
+        self.prod_codes = []
+        # one entry per added row, in arrival order until compute() buckets them
+        self.entry_loc = array('l')
+        self.entry_prod = array('l')
+        self.entry_qty = array('d')
+        self.offsets = None
+        self.subtree = None
+        self.subtree_locals = None
+
+    def add(self, cod, codprod, qty):
+        i = self.index.get(cod)
+        if i is None or codprod is None:
+            return
+        qty = float(qty or 0)
+        self.own[i] += qty
+        k = self.prod_index.get(codprod)
+        if k is None:
+            k = self.prod_index[codprod] = len(self.prod_codes)
+            self.prod_codes.append(codprod)
+        self.entry_loc.append(i)
+        self.entry_prod.append(k)
+        self.entry_qty.append(qty)
+
+    def compute(self):
+        """Fold location totals bottom-up (children before parents) and bucket the
+        product entries by location (a stable counting sort over flat arrays)."""
+        n = len(self.cods)
+        self.subtree = array('d', self.own)
+        self.subtree_locals = array('l', [1] * n)
+        for i in sorted(range(n), key=lambda k: self.info[k]['LOCAL_DEPTH'], reverse=True):
+            p = self.parent[i]
+            if p < 0:
+                continue
+            self.subtree[p] += self.subtree[i]
+            self.subtree_locals[p] += self.subtree_locals[i]
+        offsets = array('l', [0] * (n + 1))
+        for i in self.entry_loc:
+            offsets[i + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        m = len(self.entry_loc)
+        prods, qtys = array('l', [0] * m), array('d', [0.0] * m)
+        cursor = array('l', offsets)
+        for i, k, qty in zip(self.entry_loc, self.entry_prod, self.entry_qty):
+            j = cursor[i]
+            prods[j], qtys[j] = k, qty
+            cursor[i] = j + 1
+        self.offsets, self.entry_prod, self.entry_qty = offsets, prods, qtys
+        self.entry_loc = None
+        return self
+
+    def _own_by_prod(self, i):
+        """{product index: own quantity} of location I, summed in arrival order."""
+        acc = {}
+        prods, qtys = self.entry_prod, self.entry_qty
+        for j in range(self.offsets[i], self.offsets[i + 1]):
+            k = prods[j]
+            acc[k] = acc.get(k, 0.0) + qtys[j]
+        return acc
+
+    def _subtree_by_prod(self, i):
+        """{product index: subtree quantity} of location I: its own entries, then each child's subtree."""
+        acc = self._own_by_prod(i)
+        for c in self.children[i]:
+            for k, qty in self._subtree_by_prod(c).items():
+                acc[k] = acc.get(k, 0.0) + qty
+        return acc
+
+    def iter_location_rows(self, cods=None):
+        """Per local: one total row (CODPROD None) followed by one row per product in its subtree."""
+        for cod in (self.cods if cods is None else sorted(cods)):
+            i = self.index[cod]
+            info = self.info[i]
+            base = {k: info[k] for k in ('CODLOCAL', 'DESCRLOCAL', 'LOCAL_PATH', 'LOCAL_PATH_CODES', 'LOCAL_DEPTH')}
+            yield {**base, 'CODPROD': None, 'OWN_ESTOQUE': self.own[i],
+                   'SUBTREE_ESTOQUE': self.subtree[i], 'SUBTREE_LOCALS': self.subtree_locals[i]}
+            own = self._own_by_prod(i)
+            codes = self.prod_codes
+            for codprod, k, qty in sorted((codes[k], k, qty) for k, qty in self._subtree_by_prod(i).items()):
+                yield {**base, 'CODPROD': codprod, 'OWN_ESTOQUE': own.get(k, 0.0),
+                       'SUBTREE_ESTOQUE': qty, 'SUBTREE_LOCALS': None}
+
+    def iter_depth_rows(self, cods=None):
+        """Subtotals of own stock per depth: one total row (CODPROD None) plus one per product."""
+        by_depth = {}
+        for cod in (self.cods if cods is None else cods):
+            i = self.index[cod]
+            depth = self.info[i]['LOCAL_DEPTH']
+            locals_, total, prods = by_depth.get(depth, (0, 0.0, {}))
+            for k, qty in self._own_by_prod(i).items():
+                codprod = self.prod_codes[k]
+                prods[codprod] = prods.get(codprod, 0.0) + qty
+            by_depth[depth] = (locals_ + 1, total + self.own[i], prods)
+        for depth in sorted(by_depth):
+            locals_, total, prods = by_depth[depth]
+            yield {'LOCAL_DEPTH': depth, 'CODPROD': None, 'LOCALS': locals_, 'TOTAL_ESTOQUE': total}
+            for codprod, qty in sorted(prods.items()):
+                yield {'LOCAL_DEPTH': depth, 'CODPROD': codprod, 'LOCALS': None, 'TOTAL_ESTOQUE': qty}
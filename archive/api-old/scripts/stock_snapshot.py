@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Per-local product aggregates kept between runs for incremental reports.
+The snapshot (SQLite) holds the last TGFEST aggregates of every local it has
+seen plus the server time each local was last synced. sync() asks the server
+only which locals had movements since then (TGFEST.DTULTMOV / TGFCAB.DTALTER),
+refetches those (plus locals never seen before), merges them in and returns the
+change set; reports are then rendered from the snapshot.
+Usage:
+    snap = StockSnapshot(BASE / 'stock_snapshot.sqlite')
+    refetched, changes = sync(client, snap, cods)
+    for cod, rows in snap.iter_groups(cods):
+        ...
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import stock_queries
+
+# movements committed just before the previous watermark may only become visible later
+WATERMARK_OVERLAP = timedelta(minutes=10)
+# beyond this, a full refresh is cheaper and safer than a delta
+MAX_DELTA_AGE = timedelta(days=7)
+
+PRODUCT_COLUMNS = ('CODLOCAL', 'CODPROD', 'DESCRPROD', 'UNIDADE', 'MARCA', 'NCM', 'TOTAL_ESTOQUE')
+CHANGE_FIELDS = ['CODLOCAL', 'CODPROD', 'DESCRPROD', 'CHANGE', 'OLD_ESTOQUE', 'NEW_ESTOQUE']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prod (
+    CODLOCAL INTEGER NOT NULL,
+    CODPROD INTEGER NOT NULL,
+    DESCRPROD TEXT,
+    UNIDADE TEXT,
+    MARCA TEXT,
+    NCM TEXT,
+    TOTAL_ESTOQUE REAL,
+    PRIMARY KEY (CODLOCAL, CODPROD)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS synced (CODLOCAL INTEGER PRIMARY KEY, SYNCED_AT TEXT NOT NULL);
+"""
+
+
+def _parse(ts):
+    return datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+
+
+class StockSnapshot:
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path))
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def synced_at(self, cods):
+        """{CODLOCAL: SYNCED_AT} for the CODS present in the snapshot."""
+        out = {}
+        for cod in cods:
+            row = self.db.execute('SELECT SYNCED_AT FROM synced WHERE CODLOCAL = ?', (cod,)).fetchone()
+            if row:
+                out[cod] = row[0]
+        return out
+
+    def rows(self, cod):
+        cur = self.db.execute(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM prod WHERE CODLOCAL = ? "
+                              "ORDER BY CODPROD", (cod,))
+        # same order as a full fetch (stock_queries.iter_products_by_local)
+        return sorted((dict(r) for r in cur), key=lambda r: stock_queries.collation_key(r.get('DESCRPROD')))
+
+    def iter_groups(self, cods):
+        """(CODLOCAL, rows sorted by DESCRPROD) for each of CODS with stock rows, ascending."""
+        for cod in sorted(cods):
+            rows = self.rows(cod)
+            if rows:
+                yield cod, rows
+
+    def replace(self, cod, rows):
+        """Swap COD's rows for ROWS (uncommitted); returns the change rows."""
+        old = {r['CODPROD']: r for r in self.rows(cod)}
+        new = {r['CODPROD']: r for r in rows if r.get('CODPROD') is not None}
+        changes = []
+        for codprod in sorted(old.keys() | new.keys()):
+            o, n = old.get(codprod), new.get(codprod)
+            old_qty = float(o['TOTAL_ESTOQUE'] or 0) if o else None
+            new_qty = float(n['TOTAL_ESTOQUE'] or 0) if n else None
+            if o and n and old_qty == new_qty:
+                continue
+            changes.append({'CODLOCAL': cod, 'CODPROD': codprod, 'DESCRPROD': (n or o).get('DESCRPROD'),
+                            'CHANGE': 'added' if o is None else 'removed' if n is None else 'changed',
+                            'OLD_ESTOQUE': old_qty, 'NEW_ESTOQUE': new_qty})
+        self.db.execute('DELETE FROM prod WHERE CODLOCAL = ?', (cod,))
+        self.db.executemany(
+            f"INSERT INTO prod VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})",
+            ([cod if c == 'CODLOCAL' else r.get(c) for c in PRODUCT_COLUMNS] for r in new.values()))
+        return changes
+
+    def mark_synced(self, cods, ts):
+        self.db.executemany('INSERT OR REPLACE INTO synced VALUES (?, ?)', ((c, ts) for c in cods))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def sync(client, snapshot, codlocals, full=False):
+    """Bring SNAPSHOT up to date for CODLOCALS and commit.
+    Returns (refetched CODLOCALs, change rows). The watermark is taken from the
+    server clock before anything is read, so movements during the run are
+    picked up by the next one."""
+    codlocals = {int(c) for c in codlocals}
+    now = stock_queries.server_now(client)
+    synced = snapshot.synced_at(codlocals)
+    todo = codlocals - synced.keys()
+    if synced and not full:
+        since = _parse(min(synced.values())) - WATERMARK_OVERLAP
+        if _parse(now) - since > MAX_DELTA_AGE:
+            todo = set(codlocals)
+        else:
+            todo |= stock_queries.fetch_changed_locals(client, synced.keys(), since.strftime('%Y-%m-%d %H:%M:%S'))
+    else:
+        todo = set(codlocals)
+    changes = []
+    seen = set()
+    batches = stock_queries.iter_product_batches(client, todo, use_cache=False) if todo else ()
+    for cod, rows in stock_queries.iter_products_by_local(batches):
+        seen.add(cod)
+        changes.extend(snapshot.replace(cod, rows))
+    for cod in sorted(todo - seen):
+        changes.extend(snapshot.replace(cod, []))  # no stock left in this local
+    snapshot.mark_synced(codlocals, now)
+    snapshot.commit()
+    return todo, changes
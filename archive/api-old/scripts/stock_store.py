@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Offline analytic snapshot of locations x products, for ad hoc slices.
+`snapshot` pulls TGFLOC (with paths, depth and the ancestor closure, as in
+loc_cache.py), the per-local TGFEST aggregates, the TGFPRO attributes of every
+stocked product and each product's latest purchase into one SQLite file, indexed
+on CODLOCAL, CODPROD, the path columns, MARCA and NCM. It is built next to the
+target and swapped in when complete, so readers never see a partial snapshot.
+`report` and `query` then run locally against it, with no load on the endpoint.
+Tables: loc, closure (ANCESTOR, DESCENDANT, DIST), stock (CODLOCAL, CODPROD,
+TOTAL_ESTOQUE), prod, last_purchase, meta; the stock_rows view joins them all.
+Usage:
+    python3 scripts/stock_store.py snapshot [--roots 101000,...] [--max-workers 4] [--rate 20]
+    python3 scripts/stock_store.py info
+    python3 scripts/stock_store.py report {by-local,by-product,by-marca,by-ncm,by-depth} [--root 101000]
+    python3 scripts/stock_store.py query "SELECT MARCA, SUM(TOTAL_ESTOQUE) FROM stock_rows GROUP BY 1" [--param V ...]
+report/query print the first --limit rows; --out NAME writes every row to
+docs/sqls/estoque-locais/analysis/NAME.json/.jsonl/.csv/.txt(/.parquet).
+"""
+import argparse
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import stock_queries
+from inspection_client import client_from_base
+from loc_cache import LocationCache
+from report_writers import write_report
+from tracing import stage
+
+BASE = Path('docs/sqls/estoque-locais')
+DEFAULT_PATH = BASE / 'stock_store.sqlite'
+
+# loc, closure and meta come from LocationCache's schema
+SCHEMA = """
+CREATE TABLE stock (
+    CODLOCAL INTEGER NOT NULL,
+    CODPROD INTEGER NOT NULL,
+    TOTAL_ESTOQUE REAL,
+    PRIMARY KEY (CODLOCAL, CODPROD)
+) WITHOUT ROWID;
+CREATE TABLE prod (CODPROD INTEGER PRIMARY KEY, DESCRPROD TEXT, UNIDADE TEXT, MARCA TEXT, NCM TEXT);
+CREATE TABLE last_purchase (CODPROD INTEGER PRIMARY KEY, VLRUNIT REAL, DTNEG TEXT, NUNOTA INTEGER, CODEMP INTEGER);
+CREATE VIEW stock_rows AS
+SELECT S.CODLOCAL, L.DESCRLOCAL, L.CODLOCALPAI, L.LOCAL_PATH, L.LOCAL_PATH_CODES, L.LOCAL_DEPTH,
+       S.CODPROD, P.DESCRPROD, P.UNIDADE, P.MARCA, P.NCM, S.TOTAL_ESTOQUE,
+       LP.VLRUNIT AS LAST_PURCHASE_UNIT, LP.DTNEG AS LAST_PURCHASE_DATE,
+       LP.NUNOTA AS LAST_PURCHASE_NUNOTA, LP.CODEMP AS LAST_PURCHASE_CODEMP
+FROM stock S
+JOIN loc L ON L.CODLOCAL = S.CODLOCAL
+LEFT JOIN prod P ON P.CODPROD = S.CODPROD
+LEFT JOIN last_purchase LP ON LP.CODPROD = S.CODPROD;
+"""
+# created after the bulk load
+INDEXES = """
+CREATE INDEX stock_prod ON stock (CODPROD, CODLOCAL);
+CREATE INDEX loc_path_codes ON loc (LOCAL_PATH_CODES);
+CREATE INDEX loc_path ON loc (LOCAL_PATH);
+CREATE INDEX loc_depth ON loc (LOCAL_DEPTH);
+CREATE INDEX prod_marca ON prod (MARCA);
+CREATE INDEX prod_ncm ON prod (NCM);
+ANALYZE;
+"""
+
+# canned slices; {where} becomes the --root filter on S.CODLOCAL
+_SUBTREE = 'WHERE S.CODLOCAL IN (SELECT DESCENDANT FROM closure WHERE ANCESTOR = ?)'
+REPORTS = {
+    'by-local': (
+        "SELECT S.CODLOCAL, L.DESCRLOCAL, L.LOCAL_PATH, L.LOCAL_DEPTH, COUNT(*) AS PRODUCTS, "
+        "ROUND(SUM(S.TOTAL_ESTOQUE), 4) AS TOTAL_ESTOQUE FROM stock S JOIN loc L ON L.CODLOCAL = S.CODLOCAL {where} "
+        "GROUP BY S.CODLOCAL ORDER BY L.LOCAL_PATH"),
+    'by-product': (
+        "SELECT S.CODPROD, P.DESCRPROD, P.UNIDADE, P.MARCA, P.NCM, COUNT(*) AS LOCALS, "
+        "ROUND(SUM(S.TOTAL_ESTOQUE), 4) AS TOTAL_ESTOQUE, LP.VLRUNIT AS LAST_PURCHASE_UNIT, LP.DTNEG AS LAST_PURCHASE_DATE "
+        "FROM stock S LEFT JOIN prod P ON P.CODPROD = S.CODPROD LEFT JOIN last_purchase LP ON LP.CODPROD = S.CODPROD "
+        "{where} GROUP BY S.CODPROD ORDER BY P.DESCRPROD"),
+    'by-marca': (
+        "SELECT P.MARCA, COUNT(DISTINCT S.CODPROD) AS PRODUCTS, COUNT(DISTINCT S.CODLOCAL) AS LOCALS, "
+        "ROUND(SUM(S.TOTAL_ESTOQUE), 4) AS TOTAL_ESTOQUE FROM stock S LEFT JOIN prod P ON P.CODPROD = S.CODPROD {where} "
+        "GROUP BY P.MARCA ORDER BY TOTAL_ESTOQUE DESC"),
+    'by-ncm': (
+        "SELECT P.NCM, COUNT(DISTINCT S.CODPROD) AS PRODUCTS, COUNT(DISTINCT S.CODLOCAL) AS LOCALS, "
+        "ROUND(SUM(S.TOTAL_ESTOQUE), 4) AS TOTAL_ESTOQUE FROM stock S LEFT JOIN prod P ON P.CODPROD = S.CODPROD {where} "
+        "GROUP BY P.NCM ORDER BY TOTAL_ESTOQUE DESC"),
+    'by-depth': (
+        "SELECT L.LOCAL_DEPTH, COUNT(DISTINCT S.CODLOCAL) AS LOCALS, COUNT(DISTINCT S.CODPROD) AS PRODUCTS, "
+        "ROUND(SUM(S.TOTAL_ESTOQUE), 4) AS TOTAL_ESTOQUE FROM stock S JOIN loc L ON L.CODLOCAL = S.CODLOCAL {where} "
+        "GROUP BY L.LOCAL_DEPTH ORDER BY L.LOCAL_DEPTH"),
+}
+
+
+def build(client, path=DEFAULT_PATH, roots=None, max_workers=4, rate=None):
+    """Pull a fresh snapshot into PATH (every local, or the subtrees of ROOTS); returns its counts."""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.unlink(missing_ok=True)
+    taken_at = stock_queries.server_now(client)
+
+    with stage('store_locations') as s:
+        cache = LocationCache(tmp, client)
+        if not cache.refresh(force=True):
+            raise SystemExit('TGFLOC download returned no rows; snapshot not taken')
+        if roots:
+            cods = set()
+            for root in roots:
+                cods.update(cache.subtree(root))
+        else:
+            cods = {r[0] for r in cache.db.execute('SELECT CODLOCAL FROM loc')}
+        cache.close()
+        s['locals'] = len(cods)
+
+    db = sqlite3.connect(str(tmp))
+    db.executescript(SCHEMA)
+    with stage('store_stock') as s:
+        for batch in stock_queries.iter_product_batches(client, cods, use_cache=False):
+            db.executemany('INSERT INTO stock VALUES (?, ?, ?)',
+                           ((r['CODLOCAL'], r['CODPROD'], r.get('TOTAL_ESTOQUE')) for r in batch))
+            db.executemany('INSERT OR IGNORE INTO prod VALUES (?, ?, ?, ?, ?)',
+                           ((r['CODPROD'], r.get('DESCRPROD'), r.get('UNIDADE'), r.get('MARCA'), r.get('NCM'))
+                            for r in batch))
+        s['rows'] = db.execute('SELECT COUNT(*) FROM stock').fetchone()[0]
+
+    with stage('store_last_purchase') as s:
+        codprods = [r[0] for r in db.execute('SELECT CODPROD FROM prod')]
+        last = stock_queries.fetch_last_purchases(client, codprods, max_workers=max_workers, rate=rate)
+        db.executemany('INSERT INTO last_purchase VALUES (?, ?, ?, ?, ?)',
+                       ((r['CODPROD'], r.get('VLRUNIT'), r.get('DTNEG'), r.get('NUNOTA'), r.get('CODEMP'))
+                        for r in last.values()))
+        s['rows'] = len(last)
+
+    with stage('store_index'):
+        db.executescript(INDEXES)
+    db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                   [('taken_at', taken_at), ('roots', ','.join(map(str, roots or ())))])
+    db.commit()
+    db.close()
+    os.replace(tmp, path)
+    return StockStore(path).info()
+
+
+class StockStore:
+    """Read-only access to a snapshot built by build()."""
+
+    def __init__(self, path=DEFAULT_PATH):
+        path = Path(path)
+        if not path.exists():
+            raise SystemExit(f'{path} not found; run: python3 scripts/stock_store.py snapshot')
+        self.db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        self.db.row_factory = sqlite3.Row
+
+    def query(self, sql, params=()):
+        """Column names and a row cursor (dicts) for SQL."""
+        cur = self.db.execute(sql, params)
+        return [d[0] for d in cur.description or ()], (dict(r) for r in cur)
+
+    def report(self, name, root=None):
+        sql = REPORTS[name].format(where=_SUBTREE if root else '')
+        return self.query(sql, [root] if root else [])
+
+    def info(self):
+        meta = dict(self.db.execute('SELECT key, value FROM meta').fetchall())
+        out = {'taken_at': meta.get('taken_at'), 'roots': meta.get('roots') or 'all'}
+        for table in ('loc', 'stock', 'prod', 'last_purchase'):
+            out[table] = self.db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        return out
+
+    def close(self):
+        self.db.close()
+
+
+def value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def print_table(fields, rows, limit):
+    rows = [[('' if r[f] is None else str(r[f])) for f in fields] for _, r in zip(range(limit), rows)]
+    widths = [max([len(f)] + [len(r[i]) for r in rows]) for i, f in enumerate(fields)]
+    print(' | '.join(f.ljust(w) for f, w in zip(fields, widths)))
+    print('-+-'.join('-' * w for w in widths))
+    for r in rows:
+        print(' | '.join(c.ljust(w) for c, w in zip(r, widths)))
+
+
+def output(args, fields, rows, started):
+    if args.out:
+        (BASE / 'analysis').mkdir(parents=True, exist_ok=True)
+        w = write_report(BASE / 'analysis' / args.out, rows, fields)
+        print('Wrote', *w.paths, 'rows:', w.count, f'({(time.perf_counter() - started) * 1000:.1f} ms)')
+    else:
+        print_table(fields, rows, args.limit)
+        print(f'({(time.perf_counter() - started) * 1000:.1f} ms)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline snapshot of locations x products for ad hoc analysis.')
+    parser.add_argument('--db', type=Path, default=DEFAULT_PATH, help='snapshot file')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('snapshot', help='pull a fresh snapshot from the inspection endpoint')
+    p.add_argument('--roots', default='', help='only the subtrees of these CODLOCALs, comma separated (default: all)')
+    p.add_argument('--max-workers', type=int, default=4)
+    p.add_argument('--rate', type=float, help='requests/second against the inspection host')
+    sub.add_parser('info', help='snapshot time and table sizes')
+    for name, help_ in (('report', 'run a canned slice'), ('query', 'run a SELECT against the snapshot')):
+        p = sub.add_parser(name, help=help_)
+        if name == 'report':
+            p.add_argument('name', choices=sorted(REPORTS))
+            p.add_argument('--root', type=int, help='only locals in the subtree of this CODLOCAL')
+        else:
+            p.add_argument('sql', help='SQLite SELECT over loc, closure, stock, prod, last_purchase or stock_rows')
+            p.add_argument('--param', action='append', default=[], help="value for a '?' placeholder, in order")
+        p.add_argument('--limit', type=int, default=50, help='rows printed to the terminal')
+        p.add_argument('--out', metavar='NAME', help='write every row to analysis/NAME.* instead of printing')
+    args = parser.parse_args()
+
+    if args.command == 'snapshot':
+        BASE.mkdir(parents=True, exist_ok=True)
+        roots = [int(c) for c in args.roots.split(',') if c.strip()]
+        client = client_from_base(BASE, pool_size=args.max_workers)
+        info = build(client, args.db, roots, args.max_workers, args.rate)
+        print('Wrote', args.db, info)
+        return
+    store = StockStore(args.db)
+    started = time.perf_counter()
+    try:
+        if args.command == 'info':
+            for k, v in store.info().items():
+                print(f'{k}: {v}')
+        elif args.command == 'report':
+            output(args, *store.report(args.name, args.root), started)
+        else:
+            output(args, *store.query(args.sql, [value(v) for v in args.param]), started)
+    except sqlite3.Error as e:  # the snapshot is opened read-only: writes fail here too
+        raise SystemExit(f'query failed: {e}')
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Per-query and per-stage instrumentation for the report scripts.
+Off unless INSPECTION_TRACE is set (to a .jsonl path, or to 1 for
+docs/sqls/estoque-locais/traces/<script>-<timestamp>.jsonl). Every
+InspectionClient.query() then appends an event with latency, response bytes,
+row count, attempts, cache hit and error type; stage() blocks add one event per
+pipeline stage. At exit a summary with p50/p95 latency per query shape (the
+normalized statement text) is printed and appended to the trace.
+INSPECTION_PROFILE=cpu and/or mem (comma separated) also runs cProfile (main
+thread only; dumped to <trace>.prof) and tracemalloc (top allocation sites).
+Usage:
+    from tracing import stage
+    with stage('discover', roots=len(ROOTS)) as s:
+        nodes = discover_descendants(ROOTS)
+        s['rows'] = len(nodes)
+"""
+import atexit
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from query_cache import normalize_query
+
+TRACE_DIR = Path('docs/sqls/estoque-locais/traces')
+_NUMBERS = re.compile(r'\b\d+\b')
+
+
+def query_shape(query):
+    """(id, text) of a statement with literal numbers collapsed (TOP n, MAXRECURSION n)."""
+    text = _NUMBERS.sub('N', normalize_query(query))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:10], text
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    s = sorted(values)
+    return s[max(0, math.ceil(p / 100 * len(s)) - 1)]
+
+
+class Tracer:
+    def __init__(self, path=None, profile=()):
+        self.path = Path(path) if path else None
+        self.enabled = self.path is not None
+        self.profile = set(profile)
+        self.lock = threading.Lock()
+        self.queries = defaultdict(list)  # shape id -> [event]
+        self.shapes = {}
+        self.stages = []
+        self.file = None
+        self.profiler = None
+        self.prof_path = self.path.with_suffix('.prof') if self.path else TRACE_DIR / 'session.prof'
+        if self.enabled:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = self.path.open('a', encoding='utf-8')
+        if 'cpu' in self.profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if 'mem' in self.profile:
+            import tracemalloc
+            tracemalloc.start(10)
+
+    @classmethod
+    def from_env(cls):
+        trace = os.environ.get('INSPECTION_TRACE', '')
+        profile = [p.strip() for p in os.environ.get('INSPECTION_PROFILE', '').split(',') if p.strip()]
+        if trace in ('', '0') and not profile:
+            return cls()
+        default = TRACE_DIR / f"{Path(sys.argv[0]).stem or 'session'}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        path = None if trace in ('', '0') else default if trace == '1' else Path(trace)
+        tracer = cls(path, profile)
+        tracer.prof_path = (path or default).with_suffix('.prof')
+        atexit.register(tracer.finish)
+        return tracer
+
+    def event(self, kind, **fields):
+        if not self.enabled:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'kind': kind,
+                           'thread': threading.current_thread().name, **fields}, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def query(self, query, started, **fields):
+        """Record one InspectionClient.query() call that began at perf_counter() STARTED."""
+        if not self.enabled:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        shape, text = query_shape(query)
+        ev = {'shape': shape, 'ms': round(ms, 2), **fields}
+        with self.lock:
+            self.shapes.setdefault(shape, text)
+            self.queries[shape].append(ev)
+        self.event('query', **ev)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time a pipeline stage; the yielded dict is recorded with it (e.g. s['rows'] = n)."""
+        info = dict(fields)
+        started = time.perf_counter()
+        try:
+            yield info
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            if self.enabled:
+                self.stages.append((name, ms, info))
+                self.event('stage', name=name, ms=round(ms, 2), **info)
+
+    def summary(self):
+        """One row per query shape, slowest total first."""
+        rows = []
+        for shape, events in self.queries.items():
+            timed = [e['ms'] for e in events if not e.get('cache_hit')] or [e['ms'] for e in events]
+            rows.append({
+                'shape': shape,
+                'calls': len(events),
+                'cache_hits': sum(1 for e in events if e.get('cache_hit')),
+                'errors': sum(1 for e in events if e.get('error')),
+                'retries': sum(max(0, e.get('attempts', 1) - 1) for e in events),
+                'p50_ms': round(percentile(timed, 50), 2),
+                'p95_ms': round(percentile(timed, 95), 2),
+                'total_ms': round(sum(e['ms'] for e in events), 2),
+                'rows': sum(e.get('rows', 0) for e in events),
+                'bytes': sum(e.get('bytes', 0) for e in events),
+                'query': self.shapes[shape],
+            })
+        return sorted(rows, key=lambda r: -r['total_ms'])
+
+    def finish(self):
+        if self.enabled:
+            print(f'\n-- stages ({self.path})')
+            for name, ms, info in self.stages:
+                print(f'{name:<24} {ms / 1000:>9.2f}s', *(f'{k}={v}' for k, v in info.items()))
+            print('-- queries by shape (ms; cache hits excluded from percentiles)')
+            print(f"{'shape':<10} {'calls':>6} {'hits':>5} {'err':>4} {'p50':>9} {'p95':>9} {'total s':>9} "
+                  f"{'rows':>8} {'MB':>7}  query")
+            for r in self.summary():
+                print(f"{r['shape']:<10} {r['calls']:>6} {r['cache_hits']:>5} {r['errors']:>4} {r['p50_ms']:>9.1f} "
+                      f"{r['p95_ms']:>9.1f} {r['total_ms'] / 1000:>9.2f} {r['rows']:>8} {r['bytes'] / 1e6:>7.2f}  "
+                      f"{r['query'][:80]}")
+                self.event('summary', **r)
+            self.file.close()
+        if self.profiler:
+            import pstats
+            self.profiler.disable()
+            self.prof_path.parent.mkdir(parents=True, exist_ok=True)
+            self.profiler.dump_stats(str(self.prof_path))
+            print(f'\n-- cProfile (main thread), full stats in {self.prof_path}')
+            pstats.Stats(self.profiler).sort_stats('cumulative').print_stats(20)
+        if 'mem' in self.profile:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            print(f'\n-- tracemalloc: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB')
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:10]:
+                print(stat)
+            tracemalloc.stop()
+
+
+TRACER = Tracer.from_env()
+stage = TRACER.stage
+event = TRACER.event